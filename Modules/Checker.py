@@ -0,0 +1,364 @@
+import json
+import math
+import re
+import threading
+from os import path
+
+from ..settings import get_meta_file_path, get_settings
+from .ProcessManager import ProcessManager
+
+# line breaks str.splitlines() knows besides \n, streaming gives up on them
+other_line_breaks_re = re.compile('[\x0b\x0c\x1c-\x1e\x85\u2028\u2029]')
+
+# (source file, checker config) -> Checker, so prepared answers outlive a panel
+_checkers = {}
+_checkers_lock = threading.Lock()
+
+
+class Checker(object):
+    """
+    Decides whether an output answers a test. prepare() turns an expected
+    answer into whatever the comparison needs and is memoized per answer,
+    so every expected answer is normalized once, not once per check.
+    """
+
+    max_prepared = 256
+    # whether check() looks at the test's input
+    needs_input = False
+
+    def __init__(self):
+        self.prepared = {}
+        self.lock = threading.Lock()
+
+    def describe(self):
+        return self.name
+
+    def get_prepared(self, answer):
+        with self.lock:
+            prepared = self.prepared.get(answer)
+        if prepared is None:
+            prepared = self.prepare(answer)
+            with self.lock:
+                if len(self.prepared) >= self.max_prepared:
+                    self.prepared.clear()
+                self.prepared[answer] = prepared
+        return prepared
+
+    def prepare(self, answer):
+        return answer
+
+    def check(self, inp, output, answers):
+        """True if output matches any of the expected answers."""
+        return any(self.compare(inp, output, answer, self.get_prepared(answer)) for answer in answers)
+
+    def compare(self, inp, output, answer, prepared):
+        return output == prepared
+
+    def stream(self, answers):
+        """A StreamMatcher fed the output as it arrives, None if this checker needs all of it."""
+        return None
+
+
+def shorten(s, n=40):
+    return s if len(s) <= n else s[:n] + '…'
+
+
+class LineStream(object):
+    """
+    Applies ExactChecker's rules to output chunks as they arrive and fails
+    on the first complete line no continuation could fix.
+    """
+
+    def __init__(self, expected):
+        self.expected = expected.split('\n')
+        self.line = 0
+        self.partial = []
+        self.started = False
+        self.gave_up = False
+        self.mismatch = None
+
+    def feed(self, chunk):
+        if self.mismatch is not None:
+            return False
+        if self.gave_up:
+            return True
+        if not self.started:
+            # the whole output is strip()ped, so is its leading whitespace
+            chunk = chunk.lstrip()
+            if not chunk:
+                return True
+            self.started = True
+        if '\n' not in chunk:
+            self.partial.append(chunk)
+            return True
+        lines = chunk.split('\n')
+        lines[0] = ''.join(self.partial) + lines[0]
+        self.partial = [lines.pop()]
+        for line in lines:
+            if not self.__line(line.rstrip()):
+                return self.mismatch is None
+        return True
+
+    def __line(self, line):
+        if self.line < len(self.expected):
+            expected = self.expected[self.line]
+            matches = line == expected
+        else:
+            # anything but trailing blank lines after the answer
+            expected = None
+            matches = not line
+        if not matches and other_line_breaks_re.search(line):
+            self.gave_up = True
+            return False
+        if not matches:
+            self.mismatch = 'line {}: expected {}, got "{}"'.format(
+                self.line + 1, 'end of output' if expected is None else '"{}"'.format(shorten(expected)), shorten(line))
+            return False
+        self.line += 1
+        return True
+
+
+class TokenStream(object):
+    """Compares output tokens with the expected ones as chunks arrive."""
+
+    def __init__(self, checker, prepared):
+        self.checker = checker
+        self.prepared = prepared
+        self.count = checker.count_tokens(prepared)
+        self.n = 0
+        self.partial = ''
+        self.mismatch = None
+
+    def feed(self, chunk):
+        if self.mismatch is not None:
+            return False
+        if not chunk:
+            return True
+        tokens = chunk.split()
+        if self.partial:
+            if chunk[0].isspace():
+                tokens.insert(0, self.partial)
+            elif tokens:
+                tokens[0] = self.partial + tokens[0]
+            self.partial = ''
+        if tokens and not chunk[-1].isspace():
+            self.partial = tokens.pop()
+        for token in tokens:
+            if self.n >= self.count:
+                self.mismatch = 'token {}: expected end of output, got "{}"'.format(self.n + 1, shorten(token))
+                return False
+            if not self.checker.token_matches(self.prepared, self.n, token):
+                self.mismatch = 'token {}: expected "{}", got "{}"'.format(
+                    self.n + 1, shorten(self.checker.expected_token(self.prepared, self.n)), shorten(token))
+                return False
+            self.n += 1
+        return True
+
+
+class StreamMatcher(object):
+    """Streams for every accepted answer, failed once none of them can match anymore."""
+
+    def __init__(self, streams):
+        self.streams = streams
+        self.failed = False
+
+    def feed(self, chunk):
+        if not self.failed:
+            alive = [stream.feed(chunk) for stream in self.streams]
+            self.failed = not any(alive)
+        return not self.failed
+
+    def describe(self):
+        return self.streams[0].mismatch if self.failed else None
+
+
+class ExactChecker(Checker):
+    """Line by line after trimming trailing whitespace and surrounding blank lines."""
+
+    name = 'exact'
+
+    @staticmethod
+    def normalize(text):
+        # rstrip() keeps leading spaces but removes trailing ones
+        return '\n'.join(line.rstrip() for line in text.strip().splitlines())
+
+    def prepare(self, answer):
+        return self.normalize(answer)
+
+    def check(self, inp, output, answers):
+        output = self.normalize(output)
+        return any(output == self.get_prepared(answer) for answer in answers)
+
+    def stream(self, answers):
+        return StreamMatcher([LineStream(self.get_prepared(answer)) for answer in answers])
+
+
+class TokenChecker(Checker):
+    """Whitespace-separated tokens."""
+
+    name = 'tokens'
+
+    def prepare(self, answer):
+        return answer.split()
+
+    def check(self, inp, output, answers):
+        # the output is split once for all answers, list equality stops at the first difference
+        tokens = output.split()
+        return any(self.compare_tokens(tokens, self.get_prepared(answer)) for answer in answers)
+
+    def compare_tokens(self, tokens, prepared):
+        return tokens == prepared
+
+    def stream(self, answers):
+        return StreamMatcher([TokenStream(self, self.get_prepared(answer)) for answer in answers])
+
+    def count_tokens(self, prepared):
+        return len(prepared)
+
+    def expected_token(self, prepared, i):
+        return prepared[i]
+
+    def token_matches(self, prepared, i, got):
+        return prepared[i] == got
+
+
+class FloatChecker(TokenChecker):
+    """Tokens, numbers within an absolute or relative error of the expected ones."""
+
+    name = 'float'
+
+    def __init__(self, abs_error=1e-6, rel_error=1e-6):
+        TokenChecker.__init__(self)
+        self.abs_error = abs_error
+        self.rel_error = rel_error
+
+    def describe(self):
+        return 'float (abs {:g}, rel {:g})'.format(self.abs_error, self.rel_error)
+
+    def prepare(self, answer):
+        tokens = answer.split()
+        return (tokens, [parse_float(token) for token in tokens])
+
+    def compare_tokens(self, tokens, prepared):
+        expected, values = prepared
+        if len(tokens) != len(expected):
+            return False
+        if tokens == expected:
+            return True
+        return all(self.token_matches(prepared, i, got) for i, got in enumerate(tokens))
+
+    def count_tokens(self, prepared):
+        return len(prepared[0])
+
+    def expected_token(self, prepared, i):
+        return prepared[0][i]
+
+    def token_matches(self, prepared, i, got):
+        token, value = prepared[0][i], prepared[1][i]
+        if got == token:
+            return True
+        got_value = parse_float(got) if value is not None else None
+        if got_value is None:
+            return False
+        error = abs(got_value - value)
+        return error <= self.abs_error or error <= self.rel_error * abs(value)
+
+
+class TestlibChecker(Checker):
+    """
+    A testlib-style checker program, run as `checker <input> <output>
+    <answer>`. Exit code 0 accepts the output, anything else rejects it.
+    It is compiled on first use, the compile cache makes later
+    compiles of the unchanged checker free.
+    """
+
+    name = 'testlib'
+    timeout = 10
+    needs_input = True
+
+    def __init__(self, source):
+        Checker.__init__(self)
+        self.source = source
+        self.manager = ProcessManager(source, None, run_settings=get_settings().get('run_settings'))
+        self.compiled = None
+        self.message = ''
+
+    def describe(self):
+        return 'testlib ({})'.format(path.basename(self.source))
+
+    def compile(self):
+        """Compiles the checker once per source change, returns False on failure."""
+        try:
+            mtime = path.getmtime(self.source)
+        except OSError:
+            self.message = 'checker {} not found'.format(self.source)
+            return False
+        with self.lock:
+            if self.compiled != mtime:
+                cmp_data = self.manager.compile()
+                if cmp_data and cmp_data[0] != 0:
+                    self.message = 'checker compilation failed:\n' + cmp_data[1]
+                    return False
+                self.compiled = mtime
+        return True
+
+    def compare(self, inp, output, answer, prepared):
+        if not self.compile():
+            print('FastOlympicCoding: ' + self.message)
+            return False
+        worker = self.manager.clone()
+        files = []
+        for suffix, text in (('.in', inp), ('.out', output), ('.ans', answer)):
+            file = worker.spool_file(suffix)
+            with open(file, 'wb') as f:
+                f.write(text.encode('utf-8'))
+            files.append(file)
+        rtcode, out, _, timed_out = worker.communicate('', self.timeout, args=files)
+        self.message = out.strip()
+        return rtcode == 0 and not timed_out
+
+
+def parse_float(token):
+    try:
+        value = float(token)
+    except ValueError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+def read_checker_config(source_file):
+    """The problem's "checker" from its :meta file, else the global setting."""
+    try:
+        with open(get_meta_file_path(source_file), encoding='utf-8') as f:
+            config = json.load(f).get('checker')
+            if config:
+                return config
+    except (OSError, ValueError, AttributeError):
+        pass
+    return get_settings().get('checker', 'exact')
+
+
+def make_checker(config, source_file):
+    if isinstance(config, str):
+        config = {'type': config}
+    kind = config.get('type', 'exact')
+    if kind == 'tokens':
+        return TokenChecker()
+    if kind == 'float':
+        return FloatChecker(config.get('abs', 1e-6), config.get('rel', 1e-6))
+    if kind == 'testlib' and config.get('source'):
+        return TestlibChecker(path.join(path.dirname(source_file), config['source']))
+    return ExactChecker()
+
+
+def get_checker(source_file):
+    """The checker configured for source_file, shared by everything checking its tests."""
+    config = read_checker_config(source_file)
+    key = (source_file, json.dumps(config, sort_keys=True))
+    with _checkers_lock:
+        if key not in _checkers:
+            _checkers[key] = make_checker(config, source_file)
+        return _checkers[key]
+
+
+default_checker = ExactChecker()
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import sys
+import threading
+from collections import deque
+from os import path
+
+from ..settings import get_run_all_workers, get_settings, get_timings_trace_file, init_settings, \
+    read_settings_file, root_dir, set_project_folder, settings_file
+from .PrecompiledHeader import wait_for_builds
+from .ProcessManager import ProcessManager
+from .Tester import Tester
+from .TestStore import get_store
+from .Timings import Timings
+from .WarmPool import close_all as close_warm_pool
+
+# exit codes
+EXIT_PASSED = 0
+EXIT_FAILED = 1
+EXIT_ERROR = 3
+
+
+def load_settings(extra_files):
+    """The package's settings, its Windows overrides on Windows, then extra_files on top."""
+    files = [path.join(root_dir, settings_file)]
+    if os.name == 'nt':
+        files.append(path.join(root_dir, 'FastOlympicCoding (Windows).sublime-settings'))
+    settings = {}
+    for file in files + list(extra_files):
+        settings.update(read_settings_file(file))
+    init_settings(settings)
+
+
+def find_project_folder(source_file):
+    """The closest folder above source_file with a .TestCases folder, else the file's own."""
+    folder = path.dirname(source_file)
+    while True:
+        if path.isdir(path.join(folder, '.TestCases')):
+            return folder
+        parent = path.dirname(folder)
+        if parent == folder:
+            return path.dirname(source_file)
+        folder = parent
+
+
+def run_tests(tester, workers):
+    """Runs every test of tester, workers at a time, and waits for all of them."""
+    queue = deque(range(len(tester.tests)))
+    lock = threading.Lock()
+    done = threading.Event()
+    left = [len(queue)]
+
+    def run_next():
+        with lock:
+            if not queue:
+                return
+            i = queue.popleft()
+        tester.run_test(i, compile_first=False)
+
+    def on_stop(test_id, rtcode, runtime, crash_line=None, timed_out=False, usage=None, mismatch=None):
+        test = tester.tests[test_id]
+        test.set_cur_runtime(runtime)
+        test.set_cur_usage(usage)
+        test.set_cur_rtcode(rtcode)
+        test.timed_out = timed_out
+        test.mismatch = mismatch
+        with lock:
+            left[0] -= 1
+            finished = left[0] == 0
+        if finished:
+            done.set()
+        else:
+            run_next()
+
+    if not queue:
+        return
+    tester.on_stop = on_stop
+    for _ in range(min(workers, len(queue))):
+        run_next()
+    done.wait()
+
+
+def test_result(tester, i):
+    test = tester.tests[i]
+    is_correct = tester.check(i)
+    result = {
+        'test': i + 1,
+        'verdict': test.get_verdict(is_correct),
+        'rtcode': test.rtcode,
+        'runtime_ms': test.runtime,
+        'usage': test.usage,
+    }
+    if test.mismatch:
+        result['mismatch'] = test.mismatch
+    return result
+
+
+def run_problem(source_file, project=None, workers=None):
+    """Compiles and tests one source file, returns (result dict, exit code)."""
+    source_file = path.abspath(source_file)
+    result = {'file': source_file}
+    if not path.isfile(source_file):
+        result.update(status='error', message='no such file')
+        return (result, EXIT_ERROR)
+    set_project_folder(path.abspath(project) if project else find_project_folder(source_file))
+
+    try:
+        tests = get_store(source_file).load()
+    except (OSError, ValueError) as e:
+        result.update(status='error', message='cannot read tests: {}'.format(e))
+        return (result, EXIT_ERROR)
+    if tests is None:
+        result.update(status='error', message='no tests')
+        return (result, EXIT_ERROR)
+
+    process_manager = ProcessManager(source_file, None, run_settings=get_settings().get('run_settings'))
+    process_manager.timings = Timings(get_timings_trace_file(source_file))
+    cmp_data = process_manager.compile()
+    if cmp_data and cmp_data[0] != 0:
+        result.update(status='compilation_error', message=cmp_data[1], timings=process_manager.timings.as_dict())
+        return (result, EXIT_ERROR)
+
+    tester = Tester(process_manager, None, tests=tests)
+    try:
+        run_tests(tester, workers or get_run_all_workers())
+        results = [test_result(tester, i) for i in range(len(tests))]
+    finally:
+        tester.reset_outputs()
+
+    summary = {}
+    for x in results:
+        summary[x['verdict']] = summary.get(x['verdict'], 0) + 1
+    passed = all(x['verdict'] in ('AC', 'OK') for x in results)
+    result.update(status='passed' if passed else 'failed', checker=tester.checker.describe(),
+                  summary=summary, tests=results, timings=process_manager.timings.as_dict())
+    return (result, EXIT_PASSED if passed else EXIT_FAILED)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python3 -m Personalised_FOC',
+        description='Compiles solutions and runs their saved tests. Prints one JSON object per '
+                    'file and exits with 0 if every test passed, 1 if any failed and 3 if a file '
+                    'has no tests or does not compile.')
+    parser.add_argument('files', nargs='+', help='solution source files')
+    parser.add_argument('--settings', action='append', default=[], metavar='FILE',
+                        help='a .sublime-settings file overriding the defaults, can be repeated')
+    parser.add_argument('--project', metavar='DIR',
+                        help='folder holding .TestCases and .Compiled, found from each file by default')
+    parser.add_argument('--workers', type=int, metavar='N', help='tests run in parallel, run_all_workers by default')
+    parser.add_argument('--indent', type=int, metavar='N', help='pretty-print the JSON')
+    args = parser.parse_args(argv)
+
+    try:
+        load_settings(args.settings)
+    except (OSError, ValueError) as e:
+        parser.error('cannot read settings: {}'.format(e))
+
+    code = EXIT_PASSED
+    try:
+        for file in args.files:
+            result, file_code = run_problem(file, project=args.project, workers=args.workers)
+            print(json.dumps(result, indent=args.indent))
+            sys.stdout.flush()
+            code = max(code, file_code)
+    finally:
+        # a header started by a compile is only of use to the next run if it finishes
+        wait_for_builds()
+        close_warm_pool()
+    return code
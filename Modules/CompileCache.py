@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import threading
+import zipfile
+from os import path
+
+include_re = re.compile(r'^\s*#\s*include\s*"([^"]+)"', re.M)
+
+# (compiler path, mtime) -> output of `<compiler> --version`
+_compiler_versions = {}
+
+
+def get_compiler_version(cmd):
+    """Identifies the compiler a command starts with, memoized by its path and mtime."""
+    try:
+        compiler = shlex.split(cmd, posix=(os.name != 'nt'))[0].strip('"\'')
+    except (ValueError, IndexError):
+        return ''
+    resolved = shutil.which(compiler) or compiler
+    try:
+        mtime = path.getmtime(resolved)
+    except OSError:
+        mtime = None
+
+    cache_key = (resolved, mtime)
+    if cache_key not in _compiler_versions:
+        try:
+            p = subprocess.Popen([resolved, '--version'], stdin=subprocess.DEVNULL,
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            version = p.communicate()[0].decode('utf-8', 'ignore')
+        except OSError:
+            version = ''
+        _compiler_versions[cache_key] = resolved + '\n' + version
+    return _compiler_versions[cache_key]
+
+
+def iter_local_includes(source_file):
+    """Yields every `#include "..."` header reachable from source_file."""
+    seen = set()
+    stack = [path.abspath(source_file)]
+    while stack:
+        cur = stack.pop()
+        try:
+            with open(cur, 'rb') as f:
+                text = f.read().decode('utf-8', 'ignore')
+        except OSError:
+            continue
+        for name in include_re.findall(text):
+            header = path.normpath(path.join(path.dirname(cur), name))
+            if header not in seen and path.isfile(header):
+                seen.add(header)
+                stack.append(header)
+                yield header
+
+
+class CompileCache(object):
+    """
+    Content-addressed store of compiled binaries. Entries are keyed by the
+    source, the local headers it includes, the expanded compile command and
+    the compiler version, so a hit can skip the compiler entirely.
+    """
+
+    stats_file = 'stats.json'
+
+    def __init__(self, cache_dir, max_entries=32):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+        try:
+            with open(path.join(cache_dir, self.stats_file)) as f:
+                self.stats.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    def make_key(self, source_file, cmd):
+        h = hashlib.sha256()
+        h.update(cmd.encode('utf-8'))
+        h.update(get_compiler_version(cmd).encode('utf-8'))
+        files = [source_file] + sorted(iter_local_includes(source_file))
+        for file in files:
+            with open(file, 'rb') as f:
+                h.update(file.encode('utf-8'))
+                h.update(f.read())
+        return h.hexdigest()
+
+    def entry_path(self, key, artifact):
+        return path.join(self.cache_dir, key + path.splitext(artifact)[1])
+
+    def stamp_path(self, artifact):
+        return path.join(self.cache_dir, path.basename(artifact) + '.key')
+
+    def restore(self, key, artifacts):
+        """Puts the cached binary for key in place, returns False on a miss."""
+        for artifact in artifacts:
+            entry = self.entry_path(key, artifact)
+            if not path.exists(entry):
+                continue
+            try:
+                if not (path.exists(artifact) and self.__read_stamp(artifact) == key):
+                    shutil.copy2(entry, artifact)
+                    self.__write_stamp(artifact, key)
+                os.utime(entry, None)
+            except OSError:
+                continue
+            self.__count('hits')
+            return True
+        self.__count('misses')
+        return False
+
+    def store(self, key, artifacts):
+        for artifact in artifacts:
+            if path.exists(artifact):
+                try:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    tmp = self.entry_path(key, artifact) + '.tmp'
+                    shutil.copy2(artifact, tmp)
+                    os.replace(tmp, self.entry_path(key, artifact))
+                    self.__write_stamp(artifact, key)
+                except OSError:
+                    return
+                self.__evict()
+                return
+
+    def restore_files(self, key, artifact):
+        """
+        Puts the files stored by store_files() for key next to artifact,
+        returns False on a miss.
+        """
+        entry = path.join(self.cache_dir, key + '.zip')
+        if path.exists(entry):
+            try:
+                if not (path.exists(artifact) and self.__read_stamp(artifact) == key):
+                    folder = path.dirname(artifact)
+                    with zipfile.ZipFile(entry) as z:
+                        for name in z.namelist():
+                            tmp = path.join(folder, path.basename(name) + '.tmp')
+                            with open(tmp, 'wb') as f:
+                                f.write(z.read(name))
+                            os.replace(tmp, path.join(folder, path.basename(name)))
+                    self.__write_stamp(artifact, key)
+                os.utime(entry, None)
+            except (OSError, zipfile.BadZipFile):
+                pass
+            else:
+                self.__count('hits')
+                return True
+        self.__count('misses')
+        return False
+
+    def store_files(self, key, files, artifact):
+        """
+        Stores files as one entry, for compilers writing more than one
+        (javac, a .class per class). artifact is the one a run needs.
+        """
+        if not path.exists(artifact):
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            entry = path.join(self.cache_dir, key + '.zip')
+            with zipfile.ZipFile(entry + '.tmp', 'w') as z:
+                for file in files:
+                    z.write(file, path.basename(file))
+            os.replace(entry + '.tmp', entry)
+            self.__write_stamp(artifact, key)
+        except OSError:
+            return
+        self.__evict()
+
+    def describe(self, hit):
+        return 'compile cache {} (hits: {}, misses: {})'.format(
+            'hit' if hit else 'miss', self.stats['hits'], self.stats['misses'])
+
+    def __read_stamp(self, artifact):
+        try:
+            with open(self.stamp_path(artifact)) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def __write_stamp(self, artifact, key):
+        with open(self.stamp_path(artifact), 'w') as f:
+            f.write(key)
+
+    def __count(self, field):
+        with self.lock:
+            self.stats[field] += 1
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(path.join(self.cache_dir, self.stats_file), 'w') as f:
+                    json.dump(self.stats, f)
+            except OSError:
+                pass
+
+    def __evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            full = path.join(self.cache_dir, name)
+            if len(path.splitext(name)[0]) == 64 and not name.endswith('.tmp'):
+                entries.append((path.getmtime(full), full))
+        entries.sort()
+        for _, full in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(full)
+            except OSError:
+                pass
@@ -0,0 +1,61 @@
+import tempfile
+
+
+class OutputBuffer(object):
+    """
+    Collects a program's output. The first memory_limit characters stay in
+    memory, everything after them goes to an anonymous temporary file, so
+    the plugin's memory stays flat no matter how much the program prints.
+    """
+
+    def __init__(self, memory_limit):
+        self.memory_limit = memory_limit
+        self.chunks = []
+        self.size = 0
+        self.file = None
+
+    @property
+    def spilled(self):
+        return self.file is not None
+
+    def write(self, s):
+        self.size += len(s)
+        if self.file is not None:
+            self.file.write(s.encode('utf-8'))
+            return
+
+        self.chunks.append(s)
+        if self.size > self.memory_limit:
+            s = ''.join(self.chunks)
+            self.chunks = [s[:self.memory_limit]]
+            self.file = tempfile.TemporaryFile()
+            self.file.write(s[self.memory_limit:].encode('utf-8'))
+
+    def head(self):
+        """The in-memory part of the output."""
+        if len(self.chunks) > 1:
+            self.chunks = [''.join(self.chunks)]
+        return self.chunks[0] if self.chunks else ''
+
+    def tail(self, n):
+        """Roughly the last n characters of the output."""
+        if self.file is None:
+            return self.head()[-n:]
+        self.file.flush()
+        self.file.seek(max(0, self.file.tell() - n * 4))
+        rest = self.file.read().decode('utf-8', 'replace')
+        return rest[-n:]
+
+    def getvalue(self):
+        if self.file is None:
+            return self.head()
+        self.file.flush()
+        self.file.seek(0)
+        rest = self.file.read().decode('utf-8', 'replace')
+        self.file.seek(0, 2)
+        return self.head() + rest
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
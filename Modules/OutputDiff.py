@@ -0,0 +1,63 @@
+from .Checker import TokenChecker
+
+
+def split_lines(text):
+    """Lines the way the exact checker compares them: text stripped, each line rstripped."""
+    return [line.rstrip() for line in text.strip().split('\n')]
+
+
+def compute_diff(expected, output, max_differences=5, context=2, checker=None):
+    """
+    Compares expected and output line by line in linear time, or token by
+    token when checker compares tokens, so only the differences it judges
+    are shown. Returns a dict with 'unit' ('line' or 'token'), 'first'
+    (1-based position of the first difference, None if equal),
+    'differences' (number of differing lines or tokens) and 'hunks':
+    windows of context positions around each of the first max_differences
+    differences, as lists of (kind, position, text), kind being ' ' for a
+    common one, '-' for the expected one and '+' for the output's. A side
+    that ended has None as its text.
+    """
+    if isinstance(checker, TokenChecker):
+        prepared = checker.get_prepared(expected)
+        unit, expected_count = 'token', checker.count_tokens(prepared)
+        expected = [checker.expected_token(prepared, i) for i in range(expected_count)]
+        output = output.split()
+        # a float within the allowed error is not a difference
+        same = lambda i: i < expected_count and i < len(output) and checker.token_matches(prepared, i, output[i])
+    else:
+        unit, expected, output = 'line', split_lines(expected), split_lines(output)
+        same = lambda i: i < len(expected) and i < len(output) and expected[i] == output[i]
+
+    n = max(len(expected), len(output))
+    differing = []
+    count = 0
+    for i in range(n):
+        if not same(i):
+            count += 1
+            if len(differing) < max_differences:
+                differing.append(i)
+
+    # merge the windows of nearby differences
+    windows = []
+    for i in differing:
+        lo, hi = max(0, i - context), min(n, i + context + 1)
+        if windows and lo <= windows[-1][1]:
+            windows[-1][1] = hi
+        else:
+            windows.append([lo, hi])
+
+    hunks = []
+    for lo, hi in windows:
+        hunk = []
+        for i in range(lo, hi):
+            a = expected[i] if i < len(expected) else None
+            b = output[i] if i < len(output) else None
+            if same(i):
+                hunk.append((' ', i + 1, b))
+            else:
+                hunk.append(('-', i + 1, a))
+                hunk.append(('+', i + 1, b))
+        hunks.append(hunk)
+
+    return {'unit': unit, 'first': differing[0] + 1 if differing else None, 'differences': count, 'hunks': hunks}
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+from os import path
+
+from .CompileCache import get_compiler_version
+
+header = 'bits/stdc++.h'
+header_re = re.compile(r'^\s*#\s*include\s*<bits/stdc\+\+\.h>', re.M)
+
+# keys of headers currently being built in the background, and the threads building them
+_building = set()
+_build_threads = []
+_building_lock = threading.Lock()
+
+tmp_re = re.compile(r'\.gch\.(\d+)\.tmp$')
+
+
+def split_command(cmd):
+    try:
+        return shlex.split(cmd)
+    except ValueError:
+        return None
+
+
+def extract_flags(argv, source_file, binary_path):
+    """Drops the compiler, the source and the output from a compile command."""
+    flags = []
+    skip = False
+    for arg in argv[1:]:
+        if skip:
+            skip = False
+        elif arg == '-o':
+            skip = True
+        elif arg.startswith('-o') or arg in (source_file, binary_path, binary_path + '.exe'):
+            continue
+        else:
+            flags.append(arg)
+    return flags
+
+
+def wait_for_builds():
+    """Waits for the headers being built, for processes that exit right after compiling."""
+    with _building_lock:
+        threads = list(_build_threads)
+    for t in threads:
+        t.join()
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def uses_header(source_file):
+    try:
+        with open(source_file, 'rb') as f:
+            return header_re.search(f.read().decode('utf-8', 'ignore')) is not None
+    except OSError:
+        return False
+
+
+class PrecompiledHeader(object):
+    """
+    A precompiled <bits/stdc++.h> for one compiler and flag set. The header
+    lives in `<pch_dir>/<key>/bits/` next to its .gch, so adding that
+    directory with -I lets g++ pick the .gch up in place of the system
+    header. If the .gch is ever rejected g++ silently falls back to the
+    wrapper, which just forwards to the real header.
+    """
+
+    meta_file = 'meta.json'
+    keep = 4
+
+    def __init__(self, pch_dir, cmd, source_file, binary_path):
+        self.pch_dir = pch_dir
+        self.argv = split_command(cmd) or []
+        self.flags = extract_flags(self.argv, source_file, binary_path)
+        self.version = get_compiler_version(cmd)
+        h = hashlib.sha256()
+        h.update(self.version.encode('utf-8'))
+        h.update('\0'.join(self.flags).encode('utf-8'))
+        self.key = h.hexdigest()[:16]
+        self.include_dir = path.join(pch_dir, self.key)
+        self.header_path = path.join(self.include_dir, header)
+        self.gch_path = self.header_path + '.gch'
+
+    @classmethod
+    def for_command(cls, pch_dir, cmd, source_file, binary_path):
+        """Returns a header for cmd, or None when the compiler is not g++."""
+        if os.name == 'nt' or not uses_header(source_file):
+            return None
+        argv = split_command(cmd)
+        if not argv or 'Free Software Foundation' not in get_compiler_version(cmd) \
+                or 'clang' in get_compiler_version(cmd):
+            return None
+        return cls(pch_dir, cmd, source_file, binary_path)
+
+    def is_ready(self):
+        return self.read_meta().get('ready', False) and path.exists(self.gch_path)
+
+    def inject(self, cmd):
+        return '{} -I {}'.format(cmd, shlex.quote(self.include_dir))
+
+    def read_meta(self):
+        try:
+            with open(path.join(self.include_dir, self.meta_file)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_meta(self, meta):
+        os.makedirs(self.include_dir, exist_ok=True)
+        with open(path.join(self.include_dir, self.meta_file), 'w') as f:
+            json.dump(meta, f)
+
+    def record_compile(self, seconds, used_pch):
+        """
+        Remembers one compile time with and one without the header. Returns
+        the (without, with) pair exactly once, when both are known.
+        """
+        meta = self.read_meta()
+        field = 'compile_with' if used_pch else 'compile_without'
+        if field in meta:
+            return None
+        meta[field] = seconds
+        report = None
+        if 'compile_with' in meta and 'compile_without' in meta and not meta.get('reported'):
+            meta['reported'] = True
+            report = (meta['compile_without'], meta['compile_with'])
+        self.write_meta(meta)
+        return report
+
+    def build_async(self, on_done=None):
+        meta = self.read_meta()
+        if meta.get('ready') or meta.get('failed'):
+            return
+        with _building_lock:
+            if self.key in _building:
+                return
+            _building.add(self.key)
+
+        def build():
+            try:
+                ok = self.build()
+            finally:
+                with _building_lock:
+                    _building.discard(self.key)
+                    _build_threads.remove(t)
+            if on_done:
+                on_done(ok)
+
+        t = threading.Thread(target=build)
+        t.daemon = True
+        with _building_lock:
+            _build_threads.append(t)
+        t.start()
+
+    def build(self):
+        os.makedirs(path.dirname(self.header_path), exist_ok=True)
+        with open(self.header_path, 'w') as f:
+            # the wrapper is also what g++ reads if it ever rejects the .gch
+            f.write('#include_next <{}>\n'.format(header))
+
+        # named by our pid, prune() removes those of processes that died mid-build
+        tmp = '{}.{}.tmp'.format(self.gch_path, os.getpid())
+        cmd = [self.argv[0]] + self.flags + ['-x', 'c++-header', self.header_path, '-o', tmp]
+        start = time.time()
+        try:
+            p = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT, cwd=self.include_dir)
+            out = p.communicate()[0].decode('utf-8', 'ignore')
+            ok = p.returncode == 0
+        except OSError as e:
+            out, ok = str(e), False
+
+        meta = self.read_meta()
+        if ok:
+            os.replace(tmp, self.gch_path)
+            meta.update({'ready': True, 'build_seconds': time.time() - start, 'flags': self.flags})
+        else:
+            meta.update({'failed': True, 'error': out[-2000:]})
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+        self.write_meta(meta)
+        self.prune()
+        return ok
+
+    def prune(self):
+        """Keeps only the most recently built headers and drops unfinished ones of dead processes."""
+        try:
+            dirs = [path.join(self.pch_dir, d) for d in os.listdir(self.pch_dir)]
+        except OSError:
+            return
+        dirs = sorted((d for d in dirs if path.isdir(d)), key=path.getmtime, reverse=True)
+        for d in dirs[self.keep:]:
+            if d != self.include_dir:
+                shutil.rmtree(d, ignore_errors=True)
+        for d in dirs[:self.keep]:
+            bits = path.join(d, path.dirname(header))
+            try:
+                names = os.listdir(bits)
+            except OSError:
+                continue
+            for name in names:
+                m = tmp_re.search(name)
+                if (m and not pid_alive(int(m.group(1)))) or name.endswith('.gch.tmp'):
+                    try:
+                        os.remove(path.join(bits, name))
+                    except OSError:
+                        pass
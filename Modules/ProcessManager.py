@@ -1,10 +1,136 @@
 from os.path import dirname, split, splitext
 from os import path, setsid
+import codecs
+import hashlib
+import io
+import json
+import math
+import re
 import os
+import select
+import shlex
+import shutil
 import subprocess
 import signal
-import sublime
-from ..settings import get_binary_path 
+import sys
+import tempfile
+import time
+from ..settings import get_binary_path, get_meta_file_path, get_settings, status_message
+from .CompileCache import CompileCache
+from .PrecompiledHeader import PrecompiledHeader
+from .Timings import measure
+from .VerdictCache import file_digest
+from .WarmPool import WarmProcess, get_launcher, get_zygote, java_dump_done, java_share_flags, split_python_argv
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# limit name -> (rlimit, bytes/units per configured unit)
+rlimits = [
+    ('memory_mb', 'RLIMIT_AS', 1024 * 1024),
+    ('stack_mb', 'RLIMIT_STACK', 1024 * 1024),
+    ('cpu_seconds', 'RLIMIT_CPU', 1),
+    ('file_size_mb', 'RLIMIT_FSIZE', 1024 * 1024),
+    ('processes', 'RLIMIT_NPROC', 1),
+]
+
+# rlimit -> (its prlimit option, its ulimit flag, bytes or units per ulimit unit)
+limit_options = {
+    'RLIMIT_AS': ('--as', '-v', 1024),
+    'RLIMIT_STACK': ('--stack', '-s', 1024),
+    'RLIMIT_CPU': ('--cpu', '-t', 1),
+    'RLIMIT_FSIZE': ('--fsize', '-f', 512),
+    'RLIMIT_NPROC': ('--nproc', '-u', 1),
+}
+
+# the prlimit executable, looked up once
+_prlimit = []
+
+shell_operators = ('|', '||', '&', '&&', ';', '<', '>', '>>', '2>&1', '&>')
+
+# command template -> its tokens, None when it needs a shell
+_split_templates = {}
+
+# how often a running child's own peak memory is read from /proc
+memory_sample_interval = 0.01
+# how much our own peak may grow between measuring it and the child's exec
+spawn_peak_slack_kb = 16 * 1024
+memory_sampling = sys.platform.startswith('linux')
+
+out_of_memory_markers = ('std::bad_alloc', 'MemoryError', 'java.lang.OutOfMemoryError')
+stack_overflow_markers = ('java.lang.StackOverflowError', 'RecursionError')
+
+
+def get_own_peak_kb():
+    """Our own peak RSS in KB, None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def get_limit_wrapper(rlimits):
+    """
+    The argv prefix exec'ing a command with get_rlimits() applied: util-linux's
+    prlimit where it is installed, else /bin/sh's ulimit. Unlike a preexec_fn
+    it is safe with threads and lets subprocess spawn with vfork.
+    """
+    if not rlimits:
+        return []
+    if not _prlimit:
+        _prlimit.append(shutil.which('prlimit') if sys.platform.startswith('linux') else None)
+
+    def value(x, unit=1):
+        return 'unlimited' if x == resource.RLIM_INFINITY else str(x // unit)
+
+    if _prlimit[0]:
+        return [_prlimit[0]] + ['{}={}:{}'.format(limit_options[name][0], value(soft), value(hard))
+                                for name, soft, hard in rlimits] + ['--']
+    script = []
+    for name, soft, hard in rlimits:
+        _, flag, unit = limit_options[name]
+        # soft first: the hard limit can't go below it
+        for kind, x in (('-S', soft), ('-H', hard)):
+            if flag == '-u':
+                # bash calls the process limit -u, dash -p
+                script.append('{{ ulimit {0} -u {1} || ulimit {0} -p {1}; }} 2>/dev/null'.format(kind, value(x)))
+            else:
+                script.append('ulimit {} {} {} 2>/dev/null'.format(kind, flag, value(x, unit)))
+    return ['/bin/sh', '-c', '; '.join(script) + '; exec "$@"', 'sh']
+
+
+def get_scratch_root():
+    """Where runs of file-I/O problems get their directories: scratch_dir, else RAM-backed /dev/shm if usable."""
+    root = get_settings().get('scratch_dir')
+    if root:
+        return root
+    if path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def split_template(template):
+    """
+    Tokenizes a run_settings command template once. The placeholders are
+    filled in per token afterwards, so paths with spaces or quotes can't
+    split an argument. Templates using pipes, redirects, variables or
+    command substitution return None and keep going through /bin/sh.
+    """
+    if template not in _split_templates:
+        try:
+            tokens = shlex.split(template)
+        except ValueError:
+            tokens = None
+        if tokens is not None and (any(x in shell_operators for x in tokens)
+                                   or any(c in template for c in '$`*?~')):
+            tokens = None
+        _split_templates[template] = tokens
+    return _split_templates[template]
 
 class ProcessManager(object):
     def __init__(self, file, syntax, run_settings=None):
@@ -17,6 +143,26 @@ class ProcessManager(object):
         self.run_settings = run_settings
         self.file_name = splitext(split(file)[1])[0]
         self.binary_path = get_binary_path(file)
+        self.spooled = []
+        # the run's own working directory and the output file in it, for problems naming their files
+        self.scratch_dir = None
+        self.output_file = None
+        # our peak RSS when the last run was spawned and the highest VmHWM read from the child
+        self.spawn_peak = None
+        self.sampled_peak = None
+        # Timings the session's compiles and runs are recorded in, None to skip it
+        self.timings = None
+
+    def clone(self):
+        """Returns an idle manager for the same binary with its own process handle."""
+        worker = ProcessManager.__new__(ProcessManager)
+        worker.__dict__.update(self.__dict__)
+        worker.is_run = False
+        worker.process = None
+        worker.spooled = []
+        worker.write = worker.insert
+        worker.run = worker.run_file
+        return worker
 
     def format_command(self, cmd, args=''):
         file = split(self.file)[1]
@@ -29,17 +175,51 @@ class ProcessManager(object):
             args=args
         )
 
-    def get_compile_cmd(self):
+    def format_argv(self, template, args=[]):
+        """The argv for a command template, None if it needs a shell."""
+        tokens = split_template(template)
+        if tokens is None:
+            return None
+        argv = []
+        for token in tokens:
+            if token == '{args}':
+                argv.extend(args)
+            else:
+                argv.append(self.format_command(token, args=' '.join(args)))
+        return argv
+
+    def get_compile_template(self):
         ext = splitext(self.file)[1][1:]
         for x in self.run_settings:
             if ext in x['extensions']:
                 if x['compile_cmd'] is None:
                     return None
-                cmd_template = x['compile_cmd'].replace(self.file_name, '{binary_path}')
-                return self.format_command(cmd_template)
+                return x['compile_cmd'].replace(self.file_name, '{binary_path}')
         return -1
 
-    def get_run_cmd(self, args):
+    def get_compile_argv(self):
+        """The compile command as argv, None if it needs a shell."""
+        template = self.get_compile_template()
+        if not template or template == -1 or os.name == 'nt':
+            return None
+        return self.format_argv(template)
+
+    def get_compile_cmd(self, use_pch=True):
+        ext = splitext(self.file)[1][1:]
+        for x in self.run_settings:
+            if ext in x['extensions']:
+                if x['compile_cmd'] is None:
+                    return None
+                cmd_template = self.get_compile_template()
+                cmd = self.format_command(cmd_template)
+                if use_pch:
+                    pch = self.get_precompiled_header(cmd)
+                    if pch is not None and pch.is_ready():
+                        cmd = pch.inject(cmd)
+                return cmd
+        return -1
+
+    def get_run_template(self, args):
         ext = splitext(self.file)[1][1:]
         for x in self.run_settings:
             if ext in x['extensions']:
@@ -47,75 +227,740 @@ class ProcessManager(object):
                     return None
                 cmd_template = x['run_cmd'].replace('./"{file_name}"', '"{binary_path}"')
                 cmd_template = cmd_template.replace('"{file_name}"', '"{binary_path}"')
-                return self.format_command(cmd_template, args=args)
+                # the binary is found from any working directory, see get_io_files()
+                cmd_template = cmd_template.replace("./'{file_name}'", "'{binary_path}'")
+                if args and '{args}' not in cmd_template:
+                    cmd_template += ' {args}'
+                return cmd_template
         return -1
 
+    def get_run_cmd(self, args):
+        cmd_template = self.get_run_template(args)
+        if cmd_template is None or cmd_template == -1:
+            return cmd_template
+        return self.format_command(cmd_template, args=args)
+
+    def get_run_argv(self, args):
+        """The run command as argv, None if it needs a shell or there is none."""
+        cmd_template = self.get_run_template(' '.join(args))
+        if cmd_template is None or cmd_template == -1 or os.name == 'nt':
+            return None
+        return self.format_argv(cmd_template, args)
+
+    def compiles_to_classes(self):
+        """Whether compile_cmd is javac, which writes .class files instead of binary_path."""
+        template = self.get_compile_template()
+        if not template or template == -1:
+            return False
+        tokens = split_template(template) or template.split()
+        return bool(tokens) and re.match(r'javac(\.exe)?$', path.basename(tokens[0].strip('"\''))) is not None
+
+    def get_class_files(self):
+        """Every .class file next to the source: javac puts nested and secondary classes there too."""
+        folder = path.dirname(self.file)
+        try:
+            return sorted(path.join(folder, x) for x in os.listdir(folder) if x.endswith('.class'))
+        except OSError:
+            return []
+
+    def get_fingerprint(self):
+        """
+        Hash of what run_file() executes: the run command and the binary,
+        every class for Java, or the source for interpreted languages.
+        None if nothing to run exists.
+        """
+        if self.get_compile_template() is None:
+            # only the source itself, a change to a local module it imports goes unnoticed
+            files = [self.file]
+        elif self.compiles_to_classes():
+            if not path.exists(path.join(path.dirname(self.file), self.file_name + '.class')):
+                return None
+            # which classes the source compiles to only javac knows, so all of them
+            files = self.get_class_files()
+        else:
+            files = [self.binary_path, self.binary_path + '.exe']
+        digests = []
+        for file in files:
+            try:
+                digests.append(path.basename(file) + ':' + file_digest(file))
+            except OSError:
+                continue
+        if not digests:
+            return None
+        h = hashlib.sha256()
+        h.update(str(self.get_run_template('')).encode('utf-8'))
+        for digest in digests:
+            h.update(digest.encode('utf-8'))
+        return h.hexdigest()
+
+    def get_language_settings(self):
+        ext = splitext(self.file)[1][1:]
+        for x in self.run_settings or []:
+            if ext in x['extensions']:
+                return x
+        return {}
+
+    def get_meta(self):
+        """The problem's :meta file, {} if it has none."""
+        try:
+            with open(get_meta_file_path(self.file), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError, AttributeError):
+            return {}
+        return meta if isinstance(meta, dict) else {}
+
+    def get_limits(self, meta=None):
+        """Resource limits: the global ones, overridden per language, then per problem."""
+        limits = dict(get_settings().get('limits') or {})
+        limits.update(self.get_language_settings().get('limits') or {})
+        limits.update((self.get_meta() if meta is None else meta).get('limits') or {})
+        return limits
+
+    def get_io_files(self, meta=None):
+        """
+        (input, output) file names the problem reads and writes instead of
+        stdin and stdout, None for either that is standard. Such runs get
+        a scratch directory of their own as working directory.
+        """
+        io = (self.get_meta() if meta is None else meta).get('io') or {}
+        return tuple(path.basename(io[x]) if io.get(x) else None for x in ('input', 'output'))
+
+    def get_time_limit(self, limits=None):
+        """
+        Seconds a test may run: the problem's time_limit_seconds scaled by
+        time_limit_factor, stress_time_limit_seconds if it has none.
+        """
+        limits = self.get_limits() if limits is None else limits
+        if limits.get('time_limit_seconds'):
+            return limits['time_limit_seconds'] * (get_settings().get('time_limit_factor') or 1)
+        return get_settings().get('stress_time_limit_seconds', 4.0)
+
+    def get_rlimits(self, limits):
+        """The (rlimit name, soft, hard) triples enforcing limits, clamped to our own hard limits."""
+        values = []
+        if resource is None:
+            return values
+        for key, name, scale in rlimits:
+            if not limits.get(key) or not hasattr(resource, name):
+                continue
+            value = int(limits[key] * scale)
+            try:
+                hard = resource.getrlimit(getattr(resource, name))[1]
+            except (ValueError, OSError):
+                continue
+            if hard != resource.RLIM_INFINITY:
+                value = min(value, hard)
+            if key == 'stack_mb':
+                new_hard = hard
+            elif key == 'cpu_seconds':
+                # SIGXCPU at the soft limit, SIGKILL a second later
+                new_hard = value + 1 if hard == resource.RLIM_INFINITY else min(value + 1, hard)
+            else:
+                new_hard = value
+            values.append((name, value, new_hard))
+        return values
+
+    def get_limit_verdict(self, output_tail=''):
+        """
+        Maps how the last run ended to 'CPU_TLE', 'MLE', 'STACK' or 'OLE' when a
+        resource limit explains it, or when its peak memory is over the
+        problem's memory_limit_mb, None otherwise.
+        """
+        rtcode = self.process.returncode
+        limits = self.limits
+        usage = self.get_usage() or {}
+        # the judge's limit on peak memory holds for runs that exited cleanly too; memory_kb
+        # is only the child's own peak, a run whose peak is unknown is never judged by it
+        judged_kb = usage.get('memory_kb')
+        if limits.get('memory_limit_mb') and judged_kb is not None and judged_kb > limits['memory_limit_mb'] * 1024:
+            return 'MLE'
+        if not rtcode:
+            return None
+        sig = -rtcode if rtcode < 0 else None
+        if sig is None and rtcode > 128 and self.use_shell:
+            # /bin/sh reports a child killed by signal n as exit code 128 + n
+            sig = rtcode - 128
+
+        if sig == getattr(signal, 'SIGXCPU', None) or (limits.get('cpu_seconds') and sig == getattr(signal, 'SIGKILL', None)
+                and usage.get('cpu_ms', 0) >= limits['cpu_seconds'] * 1000):
+            return 'CPU_TLE'
+        if sig == getattr(signal, 'SIGXFSZ', None):
+            return 'OLE'
+        if any(x in output_tail for x in stack_overflow_markers):
+            return 'STACK'
+        if any(x in output_tail for x in out_of_memory_markers):
+            return 'MLE'
+        peak = (usage.get('memory_kb') or 0) * 1024
+        if limits.get('memory_mb') and peak >= 0.95 * limits['memory_mb'] * 1024 * 1024:
+            return 'MLE'
+        # the stack pages a runaway recursion touched show up in the peak RSS
+        if limits.get('stack_mb') and sig == getattr(signal, 'SIGSEGV', None) \
+                and peak >= 0.9 * limits['stack_mb'] * 1024 * 1024:
+            return 'STACK'
+        return None
+
+    def get_compile_cache(self):
+        if not get_settings().get('compile_cache', True):
+            return None
+        return CompileCache(path.join(path.dirname(self.binary_path), '.compile_cache'),
+                            max_entries=get_settings().get('compile_cache_entries', 32))
+
+    def get_precompiled_header(self, cmd):
+        if not get_settings().get('precompiled_headers', True):
+            return None
+        return PrecompiledHeader.for_command(path.join(path.dirname(self.binary_path), '.pch'),
+                                             cmd, self.file, self.binary_path)
+
     def compile(self, wait_close=True):
-        cmd = self.get_compile_cmd()
+        with measure(self.timings, 'compile', file=self.file):
+            return self.__compile()
+
+    def __compile(self):
+        cmd = self.get_compile_cmd(use_pch=False)
         if cmd:
-            p = subprocess.Popen(cmd, shell=True, stdin=subprocess.PIPE,
+            cache = self.get_compile_cache()
+            artifacts = [self.binary_path, self.binary_path + '.exe']
+            # javac writes a .class per class next to the source, cached together
+            main_class = path.join(path.dirname(self.file), self.file_name + '.class')
+            classes = self.compiles_to_classes()
+            key = None
+            if cache is not None:
+                try:
+                    key = cache.make_key(self.file, cmd)
+                except OSError:
+                    key = None
+                if key is not None and (cache.restore_files(key, main_class) if classes
+                                        else cache.restore(key, artifacts)):
+                    status_message('FastOlympicCoding: ' + cache.describe(True))
+                    return (0, '')
+            if key is not None and classes:
+                before = self.__class_mtimes()
+
+            pch = self.get_precompiled_header(cmd)
+            used_pch = pch is not None and pch.is_ready()
+            argv = self.get_compile_argv()
+            if argv is None:
+                shell_cmd = pch.inject(cmd) if used_pch else cmd
+            elif used_pch:
+                argv += ['-I', pch.include_dir]
+            start_time = time.time()
+            p = subprocess.Popen(argv or shell_cmd, shell=argv is None, stdin=subprocess.PIPE,
                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
                                  cwd=path.dirname(self.binary_path))
             out = p.communicate()[0].decode('utf-8', 'ignore')
+            if pch is not None and p.returncode == 0:
+                self.on_pch_compile(pch, time.time() - start_time, used_pch)
+            if key is not None and p.returncode == 0:
+                if classes:
+                    # the classes this compile wrote, not those of other sources in the folder
+                    cache.store_files(key, [x for x, mtime in self.__class_mtimes().items()
+                                            if before.get(x) != mtime], main_class)
+                else:
+                    cache.store(key, artifacts)
+                status_message('FastOlympicCoding: ' + cache.describe(False))
             return (p.returncode, out)
 
-    def run_file(self, args=[]):
-        cmd = self.get_run_cmd(' '.join(args))
+    def __class_mtimes(self):
+        mtimes = {}
+        for file in self.get_class_files():
+            try:
+                mtimes[file] = os.stat(file).st_mtime_ns
+            except OSError:
+                pass
+        return mtimes
+
+    def on_pch_compile(self, pch, seconds, used_pch):
+        report = pch.record_compile(seconds, used_pch)
+        if report is not None:
+            msg = 'FastOlympicCoding: precompiled <bits/stdc++.h> cut compile time from {:.2f}s to {:.2f}s'.format(*report)
+            # stderr, the command line runner's stdout is its JSON
+            print(msg, file=sys.stderr)
+            status_message(msg)
+        if not used_pch:
+            pch.build_async()
+
+    def run_file(self, args=[], stdin_file=None, stdout_file=None, input_text=None):
+        """
+        Starts the program. stdin_file/stdout_file are paths the process
+        reads its input from and writes its output to directly, instead
+        of going through pipes. input_text is written straight into the
+        input file the problem names, stdin is empty then.
+        """
+        with measure(self.timings, 'start', file=self.file):
+            self.__start(args, stdin_file, stdout_file, input_text)
+
+    def __start(self, args, stdin_file, stdout_file, input_text=None):
+        argv = self.get_run_argv(args)
         self.is_run = True
-        if sublime.platform() == 'windows':
+        self.rusage = None
+        self.sampled_peak = None
+        self.stdin_buffer = bytearray()
+        self.stdin_eof = False
+        meta = self.get_meta()
+        self.limits = self.get_limits(meta)
+        # only a memory limit is worth waking up for, runs without one report the peak they can
+        self.sample_memory = memory_sampling and bool(self.limits.get('memory_limit_mb') or self.limits.get('memory_mb'))
+        self.java_archive = None
+        cwd = self.make_scratch_dir(self.get_io_files(meta), stdin_file, input_text) or path.dirname(self.binary_path)
+        if input_text is not None and stdin_file is None:
+            stdin_file = os.devnull
+        if self.output_file and not stdout_file:
+            # ignored like on a judge, but it stays next to the output file and counts towards the limit
+            stdout_file = path.join(self.scratch_dir, '.stdout')
+        self.stdout_file = stdout_file
+        warm = self.get_language_settings().get('warm') and self.supports_event_loop()
+        if warm and argv is not None:
+            argv = self.get_warm_java_argv(argv)
+            if self.__spawn_warm(argv, stdin_file, stdout_file, cwd):
+                return
+        launcher = get_launcher() if self.supports_event_loop() else None
+        if launcher is not None:
+            launched = argv if argv is not None else ['/bin/sh', '-c', self.get_run_cmd(' '.join(args))]
+            if self.__spawn_forked(launcher, None, [], launched, stdin_file, stdout_file, cwd):
+                self.use_shell = argv is None
+                return
+        new_session = False
+        if os.name == 'nt':
             startupinfo = subprocess.STARTUPINFO()
             startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            preexec_fn = None
             use_shell = False
         else:
             startupinfo = None
-            preexec_fn = os.setsid
-            use_shell = True
-
-        self.process = subprocess.Popen(
-            cmd,
-            shell=use_shell,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            bufsize=0,
-            cwd=path.dirname(self.binary_path),
-            startupinfo=startupinfo,
-            preexec_fn=preexec_fn,
-            universal_newlines=True
-        )
+            use_shell = argv is None
+            new_session = True
+        cmd = argv if argv is not None else self.get_run_cmd(' '.join(args))
+        wrapper = get_limit_wrapper(self.get_rlimits(self.limits)) if os.name != 'nt' else []
+        if wrapper:
+            # the wrapper execs the program, its pid stays the one we wait for
+            cmd = wrapper + (['/bin/sh', '-c', cmd] if use_shell else cmd)
+
+        stdin = open(stdin_file, 'rb') if stdin_file else subprocess.PIPE
+        stdout = open(stdout_file, 'wb') if stdout_file else subprocess.PIPE
+        # the event loop in wait_output() reads raw bytes and decodes them itself
+        self.text_mode = not self.supports_event_loop()
+        self.spawn_peak = get_own_peak_kb()
+        try:
+            self.use_shell = use_shell
+            self.process = subprocess.Popen(
+                cmd,
+                shell=use_shell and not wrapper,
+                stdin=stdin,
+                stdout=stdout,
+                stderr=subprocess.STDOUT,
+                bufsize=0,
+                cwd=cwd,
+                startupinfo=startupinfo,
+                start_new_session=new_session,
+                universal_newlines=self.text_mode
+            )
+        finally:
+            # the child holds its own copies of the descriptors
+            for f in (stdin, stdout):
+                if f is not subprocess.PIPE:
+                    f.close()
+        self.start_time = time.monotonic()
+
+    def make_scratch_dir(self, io_files, stdin_file, input_text=None):
+        """
+        Creates the run's scratch directory with the input file in it, copied
+        from stdin_file or written from input_text, when the problem names
+        its files. Returns it, or None.
+        """
+        self.scratch_dir = self.output_file = None
+        input_name, output_name = io_files
+        if not input_name and not output_name:
+            return None
+        # one directory per run, so parallel tests never share the named files
+        self.scratch_dir = tempfile.mkdtemp(prefix=self.file_name + '-', dir=get_scratch_root())
+        if input_name and input_text is not None:
+            with open(path.join(self.scratch_dir, input_name), 'wb') as f:
+                f.write(input_text.encode('utf-8'))
+        elif input_name and stdin_file:
+            shutil.copyfile(stdin_file, path.join(self.scratch_dir, input_name))
+        if output_name:
+            self.output_file = path.join(self.scratch_dir, output_name)
+        return self.scratch_dir
+
+    def get_warm_java_argv(self, argv):
+        """Adds the AppCDS flags to a `java ...` argv, returns others as they are."""
+        if not re.match(r'java(\.exe)?$', path.basename(argv[0])):
+            return argv
+        archive = self.binary_path + '.jsa'
+        flags = java_share_flags(argv[0], archive, path.join(path.dirname(self.file), self.file_name + '.class'))
+        if flags and flags[0].startswith('-XX:ArchiveClassesAtExit'):
+            self.java_archive = archive
+        return argv[:1] + flags + argv[1:]
+
+    def __spawn_warm(self, argv, stdin_file, stdout_file, cwd):
+        """Forks the run from its interpreter's zygote, False when it has to start cold."""
+        split_cmd = split_python_argv(argv, self.file)
+        if split_cmd is None:
+            return False
+        interpreter, args = split_cmd
+        return self.__spawn_forked(get_zygote(interpreter), self.file, args, None, stdin_file, stdout_file, cwd)
+
+    def __spawn_forked(self, zygote, script, args, argv, stdin_file, stdout_file, cwd):
+        """
+        Has zygote fork the run, running script or execing argv, False
+        when it can't and the run has to start with Popen.
+        """
+        in_w = out_r = None
+        if stdin_file:
+            in_r = os.open(stdin_file, os.O_RDONLY)
+        else:
+            in_r, in_w = os.pipe()
+        if stdout_file:
+            out_w = os.open(stdout_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        else:
+            out_r, out_w = os.pipe()
+        try:
+            proc = zygote.spawn(script, args, cwd, self.get_rlimits(self.limits), in_r, out_w, argv=argv)
+        except OSError as e:
+            for fd in (in_w, out_r):
+                if fd is not None:
+                    os.close(fd)
+            print('FastOlympicCoding: {} failed, starting {} with Popen: {}'.format(
+                'warm start' if argv is None else 'launcher', self.file, e))
+            return False
+        finally:
+            # the zygote holds its own copies of the descriptors
+            os.close(in_r)
+            os.close(out_w)
+
+        proc.stdin = os.fdopen(in_w, 'wb', 0) if in_w is not None else None
+        proc.stdout = os.fdopen(out_r, 'rb', 0) if out_r is not None else None
+        self.process = proc
+        self.use_shell = False
+        self.text_mode = False
+        # forked from a small process, wait4's peak is the child's own
+        self.spawn_peak = None
+        self.start_time = time.monotonic()
+        return True
+
+    def communicate(self, input, timeout, args=[], output_limit=None):
+        """Runs the program to completion on input, returns (rtcode, output, runtime, timed_out)."""
+        if self.get_io_files()[0]:
+            self.run_file(args=args, input_text=input)
+        else:
+            self.run_file(args=args)
+            self.insert(input)
+            self.finish_input()
+        out = []
+        rtcode, runtime, timed_out = self.wait_output(out.append, timeout, output_limit=output_limit)
+        return (rtcode, ''.join(out), runtime, timed_out)
+
+    def spool_file(self, suffix):
+        """Creates a file in .Compiled/.io for file-backed stdin/stdout."""
+        io_dir = path.join(path.dirname(self.binary_path), '.io')
+        os.makedirs(io_dir, exist_ok=True)
+        fd, file = tempfile.mkstemp(suffix=suffix, prefix=self.file_name + '-', dir=io_dir)
+        os.close(fd)
+        self.spooled.append(file)
+        return file
+
+    def spool_input(self, s):
+        file = self.spool_file('.in')
+        with open(file, 'wb') as f:
+            f.write(s.encode('utf-8'))
+        return file
 
     def insert(self, s):
-        if self.process.poll() is None:
+        if self.process.returncode is None and self.process.stdin is not None:
+            if s and not s.endswith('\n'):
+                s += '\n'
+            if not self.text_mode:
+                # written by wait_output() while it drains stdout, so a big
+                # input can't deadlock against a full output pipe
+                self.stdin_buffer += s.encode('utf-8')
+                return
             try:
-                if s and not s.endswith('\n'):
-                    s += '\n'
                 self.process.stdin.write(s)
                 self.process.stdin.flush()
             except (IOError, BrokenPipeError):
                 pass
 
     def finish_input(self):
-        try:
-            self.process.stdin.close()
-        except Exception:
-            pass
+        self.stdin_eof = True
+        if self.text_mode or not self.stdin_buffer:
+            try:
+                self.process.stdin.close()
+            except Exception:
+                pass
 
     def read(self, bfsize=None):
         if bfsize is None:
-            return self.process.stdout.read()
+            s = self.process.stdout.read()
         else:
-            return self.process.stdout.read(bfsize)
+            s = self.process.stdout.read(bfsize)
+        return s if self.text_mode else s.decode('utf-8', 'replace')
 
     def is_stopped(self):
         return self.process.poll()
 
-    def terminate(self):
-        if self.process.poll() is not None: return
-        if sublime.platform() == 'linux':
+    @staticmethod
+    def supports_event_loop():
+        return hasattr(select, 'poll') and hasattr(os, 'wait4') and fcntl is not None
+
+    def wait_output(self, on_out, timeout, output_limit=None):
+        """
+        Feeds decoded output to on_out until the process exits, killing it
+        once timeout seconds have passed since it was spawned or once it
+        printed more than output_limit bytes (output_exceeded is set then).
+        Returns (rtcode, runtime in ms, timed_out).
+        """
+        self.output_limit = output_limit
+        self.output_size = 0
+        self.output_exceeded = False
+        if not self.supports_event_loop():
+            result = self.__poll_output(on_out, timeout)
+        else:
+            result = self.__select_output(on_out, timeout)
+        if self.output_file:
+            # the answer is the output file, what went to stdout is ignored like on a judge
+            self.__read_output(on_out, self.output_file)
+        elif self.stdout_file:
+            self.__read_output(on_out, self.stdout_file)
+        if self.scratch_dir:
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+            self.scratch_dir = self.output_file = None
+        if self.java_archive:
+            java_dump_done(self.java_archive)
+            self.java_archive = None
+        while self.spooled:
+            try:
+                os.remove(self.spooled.pop())
+            except OSError:
+                pass
+        return result
+
+    def __select_output(self, on_out, timeout):
+        proc = self.process
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')('replace'), True)
+        poller = select.poll()
+        out_fd = None
+        if proc.stdout is not None:
+            out_fd = proc.stdout.fileno()
+            poller.register(out_fd, select.POLLIN)
+        in_fd = None
+        if proc.stdin is not None and not proc.stdin.closed:
+            in_fd = proc.stdin.fileno()
+            fcntl.fcntl(in_fd, fcntl.F_SETFL, fcntl.fcntl(in_fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+            poller.register(in_fd, select.POLLOUT)
+        pidfd = None
+        if hasattr(os, 'pidfd_open'):
+            try:
+                pidfd = os.pidfd_open(proc.pid)
+                poller.register(pidfd, select.POLLIN)
+            except OSError:
+                pidfd = None
+
+        deadline = self.start_time + timeout
+        end_time = None
+        timed_out = False
+        out_open = out_fd is not None
+        in_offset = 0
+        try:
+            while out_open or proc.returncode is None:
+                if proc.returncode is None:
+                    if self.__reap(os.WNOHANG):
+                        end_time = time.monotonic()
+                        continue
+                    wait = deadline - time.monotonic()
+                    if self.spawn_peak is not None and self.sample_memory:
+                        self.__sample_memory()
+                        wait = min(wait, memory_sample_interval)
+                    if wait <= 0:
+                        self.kill()
+                        timed_out = True
+                        self.__reap(0)
+                        end_time = time.monotonic()
+                        continue
+                    if pidfd is None and not out_open:
+                        # nothing left to wake us up on exit, check it every millisecond
+                        wait = min(wait, 0.001)
+                    if self.stdout_file and self.output_limit:
+                        wait = min(wait, 0.05)
+                        self.__count_output_files()
+                else:
+                    # exited: drain what is already in the pipe, grandchildren
+                    # keeping it open must not hold the verdict back
+                    wait = 0
+
+                events = poller.poll(int(math.ceil(wait * 1000)))
+                if not events and proc.returncode is not None:
+                    break
+                for fd, _ in events:
+                    if fd == out_fd:
+                        data = os.read(out_fd, 65536)
+                        if data:
+                            self.__count_output(len(data))
+                            on_out(decoder.decode(data))
+                        else:
+                            out_open = False
+                            poller.unregister(out_fd)
+                    elif fd == in_fd:
+                        try:
+                            in_offset += os.write(in_fd, memoryview(self.stdin_buffer)[in_offset:in_offset + 65536])
+                        except BlockingIOError:
+                            pass
+                        except OSError:
+                            # the program stopped reading, the rest of the input is dropped
+                            in_offset = len(self.stdin_buffer)
+                        if in_offset >= len(self.stdin_buffer):
+                            poller.unregister(in_fd)
+                            in_fd = None
+                            self.stdin_buffer = bytearray()
+                            if self.stdin_eof:
+                                self.finish_input()
+                    elif fd == pidfd:
+                        poller.unregister(pidfd)
+                        # the WNOHANG wait4 above may have reaped it already
+                        if proc.returncode is None and self.__reap(0):
+                            end_time = time.monotonic()
+        finally:
+            if pidfd is not None:
+                os.close(pidfd)
+            if in_fd is not None:
+                self.stdin_buffer = bytearray()
+                self.finish_input()
+
+        if self.rusage is None and isinstance(proc, WarmProcess):
+            # its zygote's reader thread may have set the exit status before __reap() looked
+            self.rusage = proc.rusage
+        tail = decoder.decode(b'', True)
+        if tail:
+            on_out(tail)
+        runtime = int(((end_time or time.monotonic()) - self.start_time) * 1000)
+        return (proc.returncode, runtime, timed_out)
+
+    def __count_output_files(self):
+        """Counts what went to the stdout file and to the problem's output file so far."""
+        size = 0
+        for file in (self.stdout_file, self.output_file):
             try:
-                os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
-            except ProcessLookupError:
+                size += path.getsize(file) if file else 0
+            except OSError:
                 pass
+        self.__count_output(size, absolute=True)
+
+    def __count_output(self, size, absolute=False):
+        self.output_size = size if absolute else self.output_size + size
+        if self.output_limit and self.output_size > self.output_limit and not self.output_exceeded:
+            self.output_exceeded = True
+            self.kill()
+
+    def __read_output(self, on_out, file):
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')('replace'), True)
+        size = 0
+        try:
+            with open(file, 'rb') as f:
+                for data in iter(lambda: f.read(65536), b''):
+                    on_out(decoder.decode(data))
+                    size += len(data)
+                    if self.output_limit and size >= self.output_limit:
+                        break
+        except OSError:
+            return
+        s = decoder.decode(b'', True)
+        if s:
+            on_out(s)
+
+    def __sample_memory(self):
+        """Keeps the highest VmHWM of the running child, the peak RSS of its own memory since exec."""
+        # right after spawn it may still be mid-exec, with next to nothing mapped yet
+        if time.monotonic() - self.start_time < memory_sample_interval:
+            return
+        try:
+            with open('/proc/{}/status'.format(self.process.pid), 'rb') as f:
+                for line in f:
+                    if line.startswith(b'VmHWM:'):
+                        self.sampled_peak = max(self.sampled_peak or 0, int(line.split()[1]))
+                        return
+        except (OSError, ValueError, IndexError):
+            pass
+
+    def get_usage(self):
+        """
+        CPU time (ms) and peak RSS (KB) of the last run, None if unknown.
+        Runs forked by the launcher or a zygote report their own peak. For
+        one started with Popen wait4's peak includes what the child inherited
+        from us before exec, so it only counts when it is clearly above our own
+        peak at spawn. Otherwise the peak is what __sample_memory() saw, None
+        if it never ran.
+        """
+        if self.rusage is None:
+            return None
+        peak = self.rusage.ru_maxrss
+        if sys.platform == 'darwin':
+            peak //= 1024
+        if self.spawn_peak is not None and peak <= self.spawn_peak + spawn_peak_slack_kb:
+            peak = self.sampled_peak
+        return {
+            'cpu_ms': int((self.rusage.ru_utime + self.rusage.ru_stime) * 1000),
+            'memory_kb': peak
+        }
+
+    def __reap(self, options):
+        """Collects the exit status and rusage with wait4, returns True once exited."""
+        proc = self.process
+        try:
+            pid, status, rusage = os.wait4(proc.pid, options)
+        except ChildProcessError:
+            # not our child: a warm run forked by a zygote reports its own exit
+            if options == 0:
+                proc.wait()
+            else:
+                proc.poll()
+            if isinstance(proc, WarmProcess):
+                self.rusage = proc.rusage
+            return proc.returncode is not None
+        if pid == 0:
+            return False
+        self.rusage = rusage
+        if os.WIFSIGNALED(status):
+            proc.returncode = -os.WTERMSIG(status)
         else:
-            self.process.kill()
\ No newline at end of file
+            proc.returncode = os.WEXITSTATUS(status)
+        return True
+
+    def __poll_output(self, on_out, timeout):
+        timed_out = False
+        while self.is_stopped() is None:
+            if self.spawn_peak is not None and self.sample_memory:
+                self.__sample_memory()
+            if time.monotonic() - self.start_time > timeout:
+                self.terminate()
+                timed_out = True
+                break
+
+            s = self.read(bfsize=4096) if self.process.stdout else None
+            if s:
+                self.__count_output(len(s))
+                on_out(s)
+            else:
+                if self.stdout_file and self.output_limit:
+                    self.__count_output_files()
+                time.sleep(0.01)
+
+        runtime = int((time.monotonic() - self.start_time) * 1000)
+        try:
+            s = self.read()
+            if s: on_out(s)
+        except: pass
+        return (self.is_stopped(), runtime, timed_out)
+
+    def kill(self):
+        self.terminate(sig=getattr(signal, 'SIGKILL', None))
+
+    def terminate(self, sig=None):
+        if self.process.returncode is not None: return
+        if sys.platform.startswith('linux'):
+            try:
+                os.killpg(self.process.pid, sig or signal.SIGTERM)
+            except (ProcessLookupError, PermissionError):
+                pass
+        else:
+            try:
+                self.process.kill()
+            except OSError:
+                pass
@@ -0,0 +1,217 @@
+"""
+Warm Python worker for FastOlympicCoding's warm runtime pool.
+
+Started as `python3 PythonZygote.py <socket fd>` by WarmPool, it imports the
+modules solutions usually need once and then forks a fresh child for every
+request it receives on the datagram socket. A request is a JSON object with
+the script, its args, the working directory and rlimits, sent together with
+the child's stdin and stdout descriptors. The zygote replies with the child's
+pid and later with its wait4 status and rusage. Nothing here may import from
+the plugin, this file runs in the solution's interpreter.
+
+Started as `python3 -S PythonZygote.py <socket fd> exec` it is the launcher of
+every other run instead: it imports nothing more and execs the request's argv
+in the child, whose wait4 peak RSS then starts from this small process and
+not from the editor's.
+"""
+import array
+import atexit
+import io
+import json
+import os
+import runpy
+import signal
+import socket
+import sys
+import threading
+import traceback
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def preload():
+    """Loaded once here, so children start with them already imported."""
+    for name in ('collections', 'heapq', 'bisect', 'math', 'itertools', 'functools', 're',
+                 'string', 'random', 'fractions', 'decimal', 'operator', 'copy', 'typing'):
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+
+def flush_stdout():
+    try:
+        sys.stdout.flush()
+    except (OSError, ValueError):
+        pass
+
+
+def run_script(script, args):
+    """Runs script as __main__ like a cold interpreter would, returns its exit code."""
+    sys.argv = [script] + args
+    sys.path[0] = os.path.dirname(script)
+    sys.stdin = sys.__stdin__ = io.open(0, 'r', encoding='utf-8', closefd=False)
+    sys.stdout = sys.__stdout__ = io.open(1, 'w', encoding='utf-8', closefd=False)
+    sys.stderr = sys.__stderr__ = io.open(2, 'w', buffering=1, encoding='utf-8',
+                                          errors='backslashreplace', closefd=False)
+    code = 0
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            flush_stdout()
+            sys.stderr.write('{}\n'.format(e.code))
+            code = 1
+    except BaseException as e:
+        # like the interpreter: output first, then the traceback without our own frames
+        flush_stdout()
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != script:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb)
+        code = 1
+    try:
+        atexit._run_exitfuncs()
+    except BaseException:
+        pass
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except (OSError, ValueError):
+            code = code or 120
+    return code
+
+
+def start_child(request, fds):
+    in_fd, out_fd = fds
+    os.setsid()
+    os.dup2(in_fd, 0)
+    os.dup2(out_fd, 1)
+    os.dup2(out_fd, 2)
+    os.close(in_fd)
+    os.close(out_fd)
+    if resource is not None:
+        for name, soft, hard in request.get('rlimits', []):
+            try:
+                resource.setrlimit(getattr(resource, name), (soft, hard))
+            except (AttributeError, ValueError, OSError):
+                pass
+    os.chdir(request['cwd'])
+    if 'argv' in request:
+        exec_argv(request['argv'])
+    return run_script(request['script'], request.get('args', []))
+
+
+def default_signals():
+    # the interpreter ignores these, a program started by a shell gets them by default
+    return [getattr(signal, name) for name in ('SIGPIPE', 'SIGXFSZ') if hasattr(signal, name)]
+
+
+def spawn_argv(request, fds):
+    """
+    Starts argv with posix_spawn, which is much faster than forking the
+    interpreter. None where it can't: rlimits to set in the child, Python
+    before 3.8, or argv can't be executed, start_child() reports that.
+    """
+    if request.get('rlimits') or not hasattr(os, 'posix_spawnp'):
+        return None
+    in_fd, out_fd = fds
+    argv = request['argv']
+    try:
+        # the child starts in our working directory, and nothing else here uses it
+        os.chdir(request['cwd'])
+        return os.posix_spawnp(argv[0], argv, os.environ, file_actions=[
+            (os.POSIX_SPAWN_DUP2, in_fd, 0), (os.POSIX_SPAWN_DUP2, out_fd, 1), (os.POSIX_SPAWN_DUP2, out_fd, 2),
+            (os.POSIX_SPAWN_CLOSE, in_fd), (os.POSIX_SPAWN_CLOSE, out_fd),
+        ], setsid=True, setsigdef=default_signals())
+    except (OSError, TypeError):
+        return None
+
+
+def exec_argv(argv):
+    for sig in default_signals():
+        signal.signal(sig, signal.SIG_DFL)
+    try:
+        os.execvp(argv[0], argv)
+    except OSError as e:
+        # what a shell says and exits with for a command it can't run
+        os.write(2, '{}: {}\n'.format(argv[0], e.strerror).encode('utf-8', 'replace'))
+        os._exit(127)
+
+
+def main():
+    if sys.argv[2:] != ['exec']:
+        preload()
+    sock = socket.fromfd(int(sys.argv[1]), socket.AF_UNIX, socket.SOCK_DGRAM)
+    os.close(int(sys.argv[1]))
+    sock.settimeout(1.0)
+    parent = os.getppid()
+    send_lock = threading.Lock()
+    forked = threading.Semaphore(0)
+
+    def send(message):
+        with send_lock:
+            sock.send(json.dumps(message).encode('utf-8'))
+
+    def reaper():
+        while True:
+            forked.acquire()
+            pid, status, usage = os.wait4(-1, 0)
+            send({'pid': pid, 'status': status, 'utime': usage.ru_utime,
+                  'stime': usage.ru_stime, 'maxrss': usage.ru_maxrss})
+
+    t = threading.Thread(target=reaper)
+    t.daemon = True
+    t.start()
+
+    fd_size = array.array('i').itemsize
+    while True:
+        try:
+            data, ancdata, _, _ = sock.recvmsg(65536, socket.CMSG_SPACE(2 * fd_size))
+        except socket.timeout:
+            if os.getppid() != parent:
+                return
+            continue
+        except OSError:
+            return
+        if not data:
+            return
+
+        fds = array.array('i')
+        for level, kind, cdata in ancdata:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                fds.frombytes(cdata[:len(cdata) - len(cdata) % fd_size])
+        request = json.loads(data.decode('utf-8'))
+        if len(fds) != 2:
+            for fd in fds:
+                os.close(fd)
+            send({'id': request.get('id'), 'error': 'expected stdin and stdout descriptors'})
+            continue
+
+        pid = spawn_argv(request, list(fds)) if 'argv' in request else None
+        if pid is None:
+            pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                sock.close()
+                code = start_child(request, list(fds))
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(code & 0xff)
+        for fd in fds:
+            os.close(fd)
+        forked.release()
+        send({'id': request['id'], 'pid': pid})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import threading
+import time
+import traceback
+
+from .Tester import limit_verdicts
+
+
+class StressTester(object):
+    """
+    Runs seeded iterations of generator -> brute force -> solution across a
+    pool of worker threads until the outputs disagree or the seeds run out.
+    The three ProcessManagers must already be compiled, every worker runs
+    its own clones of them.
+    """
+
+    def __init__(self, generator, brute, solution, compare, timeout=2, workers=1,
+                 output_limit=None, on_progress=None):
+        self.generator = generator
+        self.brute = brute
+        self.solution = solution
+        self.compare = compare
+        self.timeout = timeout
+        self.workers = max(1, workers)
+        self.output_limit = output_limit
+        self.on_progress = on_progress
+        self.lock = threading.Lock()
+        self.stopped = False
+        self.running = set()
+
+    def stop(self):
+        self.stopped = True
+
+    def run(self, start_seed=1, iterations=1000):
+        """
+        Blocks until done. Returns a dict with 'status' ('ok', 'mismatch',
+        'error' or 'stopped'), 'iterations', 'elapsed', 'next_seed' to resume
+        from and, unless status is 'ok', the failing 'seed', 'input',
+        'expected', 'output' and a 'message'.
+        """
+        self.next_seed = start_seed
+        self.end_seed = start_seed + iterations
+        self.done = 0
+        self.failure = None
+        start_time = time.time()
+
+        threads = [threading.Thread(target=self.__worker) for _ in range(self.workers)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            while t.is_alive():
+                t.join(0.5)
+                if self.on_progress:
+                    elapsed = time.time() - start_time
+                    self.on_progress(self.done, self.next_seed, self.done / elapsed if elapsed else 0)
+
+        result = self.failure or {'status': 'stopped' if self.stopped else 'ok'}
+        result['iterations'] = self.done
+        result['elapsed'] = time.time() - start_time
+        if self.failure is not None:
+            result['next_seed'] = self.failure['seed']
+        else:
+            result['next_seed'] = min(self.running | {self.next_seed})
+        return result
+
+    def __worker(self):
+        try:
+            gen, brute, sol = self.generator.clone(), self.brute.clone(), self.solution.clone()
+        except Exception as e:
+            traceback.print_exc()
+            with self.lock:
+                seed = self.next_seed
+            self.__report(seed, self.__failure('error', seed, '', '', '', 'Stress test failed: {}'.format(e)))
+            return
+        while True:
+            with self.lock:
+                if self.stopped or self.next_seed >= self.end_seed:
+                    return
+                seed = self.next_seed
+                self.next_seed += 1
+                self.running.add(seed)
+
+            try:
+                failure = self.__iterate(gen, brute, sol, seed)
+            except Exception as e:
+                # a worker dying silently would let run() report 'ok' for seeds nobody ran
+                traceback.print_exc()
+                failure = self.__failure('error', seed, '', '', '', 'Stress test failed on seed {}: {}'.format(seed, e))
+            self.__report(seed, failure)
+
+    def __report(self, seed, failure):
+        with self.lock:
+            self.running.discard(seed)
+            if failure is None:
+                self.done += 1
+            # report the smallest failing seed even if a later one failed first
+            elif self.failure is None or seed < self.failure['seed']:
+                self.failure = failure
+                self.stopped = True
+
+    def __iterate(self, gen, brute, sol, seed):
+        rtcode, inp, _, timed_out = gen.communicate('', self.timeout, args=[str(seed)],
+                                                   output_limit=self.output_limit)
+        if timed_out or rtcode != 0:
+            return self.__failure('error', seed, inp, '', '', 'Generator failed on seed {} ({})'.format(
+                seed, self.__describe_failure(gen, rtcode, timed_out)))
+
+        rtcode, expected, _, timed_out = brute.communicate(inp, self.timeout, output_limit=self.output_limit)
+        if timed_out or rtcode != 0:
+            return self.__failure('error', seed, inp, expected, '', 'Brute force failed on seed {} ({})'.format(
+                seed, self.__describe_failure(brute, rtcode, timed_out)))
+
+        rtcode, out, _, timed_out = sol.communicate(inp, self.timeout, output_limit=self.output_limit)
+        if timed_out:
+            message = 'Time Limit Exceeded'
+        elif sol.output_exceeded:
+            # killed by output_limit, not crashed
+            message = limit_verdicts['OLE']
+        elif rtcode != 0:
+            verdict = sol.get_limit_verdict(out[-4096:])
+            message = limit_verdicts[verdict] if verdict else 'Runtime Error (exit code {})'.format(rtcode)
+        elif not self.compare(inp, expected, out):
+            message = 'Wrong Answer'
+        else:
+            return None
+        return self.__failure('mismatch', seed, inp, expected, out, '{} on seed {}'.format(message, seed))
+
+    def __describe_failure(self, proc, rtcode, timed_out):
+        if timed_out:
+            return 'timed out'
+        if proc.output_exceeded:
+            return 'output limit exceeded'
+        return 'exit code {}'.format(rtcode)
+
+    def __failure(self, status, seed, inp, expected, out, message):
+        return {'status': status, 'seed': seed, 'input': inp, 'expected': expected,
+                'output': out, 'message': message}
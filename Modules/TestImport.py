@@ -0,0 +1,151 @@
+import os
+import re
+import zipfile
+from os import path
+
+from .VerdictCache import file_digest
+
+# answer files of `name.in` and of Polygon's extension-less `name`, in the order they are looked for
+answer_extensions = ['.out', '.ans', '.a']
+
+
+class FolderSource(object):
+    """The files under a folder, named by their path relative to it with `/` separators."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.names = []
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = [x for x in dirs if not x.startswith('.')]
+            rel = path.relpath(root, folder).replace(os.sep, '/')
+            for name in files:
+                self.names.append(name if rel == '.' else '{}/{}'.format(rel, name))
+
+    def open(self, name):
+        return open(path.join(self.folder, *name.split('/')), 'rb')
+
+    def close(self):
+        pass
+
+
+class ZipSource(object):
+    """The files of a zip archive, extracted one at a time as they are read."""
+
+    def __init__(self, file):
+        self.zip = zipfile.ZipFile(file)
+        self.names = [x.filename for x in self.zip.infolist()
+                      if not x.filename.endswith('/') and not x.filename.startswith('__MACOSX/')]
+
+    def open(self, name):
+        return self.zip.open(name)
+
+    def close(self):
+        self.zip.close()
+
+
+def open_source(source):
+    if path.isdir(source):
+        return FolderSource(source)
+    if zipfile.is_zipfile(source):
+        return ZipSource(source)
+    raise ValueError('{} is neither a folder nor a zip archive'.format(source))
+
+
+def natural_key(name):
+    return [int(x) if x.isdigit() else x.lower() for x in re.split(r'(\d+)', name)]
+
+
+def pair_tests(names):
+    """
+    (input, [answer]) pairs of file names: `name.in` with `name.out`,
+    `name.ans` or `name.a`, and `name` with `name.a` as Polygon packages
+    have them. An `.in` file without an answer is a case without one,
+    other files are ignored. Pairs are in natural order, `2` before `10`.
+    """
+    names = set(x for x in names if not x.rsplit('/', 1)[-1].startswith('.'))
+    pairs = []
+    for name in names:
+        if name.endswith('.in'):
+            stem = name[:-len('.in')]
+        elif '.' not in name.rsplit('/', 1)[-1]:
+            stem = name
+        else:
+            continue
+        answers = [stem + ext for ext in answer_extensions if stem + ext in names and stem + ext != name]
+        if stem == name and not answers:
+            continue
+        pairs.append((name, answers[:1]))
+    pairs.sort(key=lambda x: natural_key(x[0]))
+    return pairs
+
+
+def case_key(test):
+    """What makes a stored case a duplicate of another: the digests of its input and answers."""
+    store, case_id = test.store, test.record['id']
+    answers = [file_digest(store.answer_path(case_id, j)) for j in range(len(test.record['answer_bytes']))]
+    return (file_digest(store.input_path(case_id)), tuple(sorted(answers)))
+
+
+def remove_case_files(store, record):
+    names = [store.input_path(record['id'])]
+    names += [store.answer_path(record['id'], j) for j in range(len(record['answer_bytes']))]
+    for name in names:
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
+
+def import_tests(store, source, replace=False, on_progress=None):
+    """
+    Streams the cases of a zip or folder into store, skipping any whose
+    input and answer are already stored or were imported before them.
+    With replace the imported cases take the place of the stored ones.
+    on_progress(done, total) is called after each pair of files. Returns
+    {'imported': ..., 'duplicates': ..., 'total': ...}.
+    """
+    # also brings the store's ids up to date, so imported files never overwrite stored ones
+    tests = store.load() or []
+    seen = set() if replace else set(case_key(x) for x in tests)
+    if replace:
+        tests = []
+
+    source = open_source(source)
+    added = []
+    try:
+        pairs = pair_tests(source.names)
+        imported = duplicates = 0
+        for done, (input_name, answer_names) in enumerate(pairs, 1):
+            copies = []
+            try:
+                for name in [input_name] + answer_names:
+                    with source.open(name) as f:
+                        copies.append(store.copy_in(f))
+                key = (copies[0][1], tuple(sorted(x[1] for x in copies[1:])))
+                if key in seen:
+                    duplicates += 1
+                else:
+                    seen.add(key)
+                    test = store.add_copied(copies[0], copies[1:])
+                    tests.append(test)
+                    added.append(test)
+                    imported += 1
+                    copies = []
+            finally:
+                for copy in copies:
+                    # add_copied() may have moved some of them before failing
+                    if path.exists(copy[0]):
+                        os.remove(copy[0])
+            if on_progress is not None:
+                on_progress(done, len(pairs))
+    except BaseException:
+        # the cases moved in so far are not in the index, their files would only be left behind
+        for test in added:
+            remove_case_files(store, test.record)
+        raise
+    finally:
+        source.close()
+
+    if imported or replace:
+        store.save(tests, wait=True)
+    return {'imported': imported, 'duplicates': duplicates, 'total': len(tests)}
@@ -0,0 +1,302 @@
+import hashlib
+import io
+import json
+import mmap
+import os
+import tempfile
+import threading
+from os import path
+
+from ..settings import get_tests_file_path
+from . import WriteBehind
+from .Tester import Test
+
+# source file -> its TestStore, one per folder so every writer shares its lock
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class MappedText(object):
+    """
+    A stored input or answer memory-mapped for previews. find(), rfind(),
+    count() and slicing work on its UTF-8 bytes and slices decode to text,
+    which is all split_preview() needs to show the first and last lines of
+    a file without reading the rest. count() only counts single bytes.
+    """
+
+    chunk = 1 << 20
+
+    def __init__(self, file):
+        st = os.stat(file)
+        self.key = (file, st.st_size, st.st_mtime_ns)
+        with open(file, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __eq__(self, other):
+        return isinstance(other, MappedText) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __len__(self):
+        return len(self.map)
+
+    def __getitem__(self, key):
+        return self.map[key].decode('utf-8', 'replace')
+
+    def byte_size(self):
+        return len(self.map)
+
+    def find(self, sub, start=0, end=None):
+        return self.map.find(sub.encode('utf-8'), start, len(self.map) if end is None else end)
+
+    def rfind(self, sub, start=0, end=None):
+        return self.map.rfind(sub.encode('utf-8'), start, len(self.map) if end is None else end)
+
+    def count(self, sub, start=0, end=None):
+        sub = sub.encode('utf-8')
+        end = len(self.map) if end is None else end
+        n = 0
+        for pos in range(start, end, self.chunk):
+            n += self.map[pos:min(end, pos + self.chunk)].count(sub)
+        return n
+
+
+class TestStore(object):
+    """
+    A problem's tests as a folder next to where its `:tests` file was:
+    `index.json` lists the cases with their sizes, and each case's input
+    and answers are files of their own, read only when a case needs them.
+    Edited and new cases get new files, so the index never points at a
+    half written case. save() hands the changed files and the index to
+    WriteBehind, files of removed and edited cases are deleted once an
+    index without them is written.
+    """
+
+    version = 1
+
+    def __init__(self, folder, legacy_file=None):
+        self.folder = folder
+        self.index_file = path.join(folder, 'index.json')
+        self.legacy_file = legacy_file
+        self.lock = threading.Lock()
+        self.next_id = 1
+        # file name -> text, written before the next index
+        self.pending = {}
+        # (test, record) of the cases whose files are in pending
+        self.pending_tests = []
+        self.index = None
+        # files the newest index refers to, and files only older ones did
+        self.referenced = set()
+        self.obsolete = set()
+        self.removing = set()
+        # file -> its MappedText, case files never change once written
+        self.mapped = {}
+
+    def input_path(self, case_id):
+        return path.join(self.folder, '{}.in'.format(case_id))
+
+    def answer_path(self, case_id, j):
+        return path.join(self.folder, '{}.ans'.format(case_id) if j == 0 else '{}.{}.ans'.format(case_id, j))
+
+    @staticmethod
+    def read(file):
+        with open(file, encoding='utf-8', newline='') as f:
+            return f.read()
+
+    def map_file(self, file):
+        """A MappedText of a case file, None if it can't be mapped."""
+        with self.lock:
+            mapped = self.mapped.get(file)
+        if mapped is None:
+            try:
+                mapped = MappedText(file)
+            except (OSError, ValueError):
+                return None
+            with self.lock:
+                self.mapped[file] = mapped
+        return mapped
+
+    def exists(self):
+        return path.exists(self.index_file) or bool(self.legacy_file and path.exists(self.legacy_file))
+
+    def load(self):
+        """The stored cases as Tests, migrating a `:tests` file first, None if there are none."""
+        WriteBehind.flush(self.index_file)
+        if not path.exists(self.index_file):
+            if not (self.legacy_file and path.exists(self.legacy_file)):
+                return None
+            self.migrate()
+        with open(self.index_file, encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('version') != self.version:
+            raise ValueError('unknown test store version {}'.format(index.get('version')))
+        with self.lock:
+            self.next_id = max(self.next_id, index.get('next_id', 1))
+            if self.index is None:
+                self.referenced = set(name for record in index['cases'] for name in self.case_files(record))
+        return [Test(record, store=self) for record in index['cases']]
+
+    def migrate(self):
+        """Moves the tests of a `:tests` JSON file into the folder, keeping the file as `.bak`."""
+        with open(self.legacy_file, encoding='utf-8') as f:
+            data = f.read()
+        tests = [Test(x) for x in json.loads(data)] if data.strip() else []
+        self.save(tests, wait=True)
+        # WriteBehind only prints a failed write, the `:tests` file stays until it worked
+        if not path.exists(self.index_file):
+            raise OSError('cannot write {}'.format(self.index_file))
+        os.replace(self.legacy_file, self.legacy_file + '.bak')
+
+    def save(self, tests, wait=False, timed=None):
+        """
+        Stores tests in this order. Only new and edited cases are written
+        again. timed() gets the seconds the write took, see WriteBehind.
+        """
+        with self.lock:
+            records = []
+            for test in tests:
+                if test.store is not self or test.dirty:
+                    case_id = self.next_id
+                    self.next_id += 1
+                    inp = test.test_string or ''
+                    answers = list(test.correct_answers)
+                    self.pending[path.basename(self.input_path(case_id))] = inp
+                    for j, answer in enumerate(answers):
+                        self.pending[path.basename(self.answer_path(case_id, j))] = answer
+                    # its text stays in memory and its files unused until they are written
+                    test.set_stored(self, {
+                        'id': case_id,
+                        'input_bytes': len(inp.encode('utf-8')),
+                        'input_ends_with_newline': inp.endswith('\n'),
+                        'answer_bytes': [len(x.encode('utf-8')) for x in answers],
+                    }, written=False)
+                    self.pending_tests.append((test, test.record))
+                records.append(test.record)
+            self.index = json.dumps({'version': self.version, 'next_id': self.next_id, 'cases': records}, indent=1)
+            referenced = set(name for record in records for name in self.case_files(record))
+            self.obsolete |= self.referenced - referenced
+            self.obsolete -= referenced
+            self.referenced = referenced
+        WriteBehind.write_later(self.index_file, self.__write_pending, self.__remove_obsolete, timed)
+        if wait:
+            WriteBehind.flush(self.index_file)
+
+    def replace(self, items, wait=True):
+        """Replaces every case with items, {'test': ..., 'correct_answers': [...]} dicts."""
+        with self.lock:
+            self.pending = {}
+            self.pending_tests = []
+        self.save([Test(x) for x in items], wait=wait)
+
+    def append(self, item):
+        """Adds a case after the stored ones, returns the number of cases."""
+        tests = self.load() or []
+        tests.append(Test(item))
+        self.save(tests, wait=True)
+        return len(tests)
+
+    def copy_in(self, stream):
+        """
+        Copies a binary stream into a temporary file of the folder, decoded
+        as UTF-8 with universal newlines, a chunk at a time. Returns
+        (temporary file, sha256 of what was written, size, ends with newline)
+        for add_copied().
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.folder)
+        h = hashlib.sha256()
+        size, last = 0, ''
+        try:
+            text = io.TextIOWrapper(stream, encoding='utf-8', errors='replace')
+            with open(fd, 'w', encoding='utf-8', newline='') as f:
+                for chunk in iter(lambda: text.read(MappedText.chunk), ''):
+                    data = chunk.encode('utf-8')
+                    h.update(data)
+                    size += len(data)
+                    last = chunk[-1]
+                    f.write(chunk)
+        except:
+            os.remove(tmp)
+            raise
+        return (tmp, h.hexdigest(), size, last == '\n')
+
+    def add_copied(self, input_copy, answer_copies):
+        """
+        Moves files made by copy_in() into place as a new case and returns
+        its Test, which is in the index once it is passed to save().
+        """
+        with self.lock:
+            case_id = self.next_id
+            self.next_id += 1
+        moved = []
+        try:
+            os.replace(input_copy[0], self.input_path(case_id))
+            moved.append(self.input_path(case_id))
+            for j, copy in enumerate(answer_copies):
+                os.replace(copy[0], self.answer_path(case_id, j))
+                moved.append(self.answer_path(case_id, j))
+        except OSError:
+            for name in moved:
+                os.remove(name)
+            raise
+        return Test({
+            'id': case_id,
+            'input_bytes': input_copy[2],
+            'input_ends_with_newline': input_copy[3],
+            'answer_bytes': [x[2] for x in answer_copies],
+        }, store=self)
+
+    def case_files(self, record):
+        names = [path.basename(self.input_path(record['id']))]
+        names += [path.basename(self.answer_path(record['id'], j)) for j in range(len(record['answer_bytes']))]
+        return names
+
+    def __write_pending(self):
+        # runs on the writer thread: the case files first, WriteBehind then replaces the index
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            pending_tests, self.pending_tests = self.pending_tests, []
+            index = self.index
+            # with what an index that failed to be written was to remove
+            self.removing, self.obsolete = self.removing | self.obsolete, set()
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            for name, text in pending.items():
+                WriteBehind.atomic_write(path.join(self.folder, name), text)
+        except:
+            # back for the next save, which writes the files and the index again
+            with self.lock:
+                pending.update(self.pending)
+                self.pending = pending
+                self.pending_tests = pending_tests + self.pending_tests
+            raise
+        for test, record in pending_tests:
+            # unless it was edited and saved as another case since
+            if test.record is record:
+                test.written = True
+        return index
+
+    def __remove_obsolete(self):
+        for name in self.removing:
+            with self.lock:
+                self.mapped.pop(path.join(self.folder, name), None)
+            try:
+                os.remove(path.join(self.folder, name))
+            except OSError:
+                pass
+        self.removing = set()
+
+
+def get_store(source_file):
+    """The TestStore of source_file's tests."""
+    legacy_file = get_tests_file_path(source_file)
+    folder = legacy_file + '.d'
+    with _stores_lock:
+        store = _stores.get(folder)
+        if store is None:
+            store = _stores[folder] = TestStore(folder, legacy_file)
+        return store
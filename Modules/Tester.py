@@ -0,0 +1,402 @@
+import hashlib
+import threading
+import time
+
+from ..settings import get_settings
+from .Checker import default_checker, get_checker
+from .OutputBuffer import OutputBuffer
+from .Timings import measure
+from .VerdictCache import file_digest
+
+# rtcodes of runs stopped by a resource limit -> their verdict
+limit_verdicts = {
+    'OLE': "Output Limit Exceeded",
+    'MLE': "Memory Limit Exceeded",
+    'STACK': "Stack Overflow",
+    'CPU_TLE': "CPU Time Limit Exceeded",
+}
+
+
+class Test(object):
+    """
+    A test case with the result of its last run. Cases of a TestStore are
+    created from their index record and read their input and answers from
+    the store's files on first use.
+    """
+
+    # stored inputs and answers up to this size are read whole for previews, bigger ones are mapped
+    preview_read_limit = 256 * 1024
+
+    def __init__(self, prop, store=None):
+        self.store = None
+        self.record = None
+        self.written = False
+        self._test_string = None
+        self._correct_answers = None
+        # bumped on every change of the input or answers
+        self.version = 0
+        if store is not None:
+            self.set_stored(store, prop)
+        elif isinstance(prop, str):
+            self.test_string = prop
+            self.correct_answers = set()
+        else:
+            self.test_string = prop.get('test', '')
+            self.correct_answers = set(prop.get('correct_answers', []))
+
+        self.fold = True
+        self.runtime = '-'
+        self.usage = None
+        self.rtcode = None
+        self.timed_out = False 
+        # the result was reused from the verdict cache instead of running
+        self.cached = False
+        # data block -> how many chunks of it the expanded case shows
+        self.preview_pages = {}
+        # (answer, checker, version, verdict) of the last check
+        self.check_memo = None
+        # where the output diverged when the run was stopped early as Wrong Answer
+        self.mismatch = None
+        # ((output, expected answer, checker), compute_diff() of them), see get_diff()
+        self.diff = None
+        self.diff_pending = None
+
+    def is_correct_answer(self, answer, checker=None):
+        if not self.correct_answers:
+            return None
+
+        checker = checker or default_checker
+        memo = self.check_memo
+        if memo is not None and memo[1] is checker and memo[0] == answer and memo[2] == self.version:
+            return memo[3]
+        inp = self.test_string if checker.needs_input else ''
+        verdict = checker.check(inp, answer, self.correct_answers)
+        self.check_memo = (answer, checker, self.version, verdict)
+        return verdict
+
+    @property
+    def test_string(self):
+        if self._test_string is None and self.store is not None:
+            self._test_string = self.store.read(self.store.input_path(self.record['id']))
+        return self._test_string
+
+    @test_string.setter
+    def test_string(self, value):
+        self._test_string = value
+        self.version += 1
+        self.dirty = True
+
+    @property
+    def correct_answers(self):
+        if self._correct_answers is None and self.store is not None:
+            self._correct_answers = set(self.store.read(self.store.answer_path(self.record['id'], j))
+                                        for j in range(len(self.record['answer_bytes'])))
+        return self._correct_answers
+
+    @correct_answers.setter
+    def correct_answers(self, value):
+        self._correct_answers = value
+        self.version += 1
+        self.dirty = True
+
+    def set_stored(self, store, record, written=True):
+        """
+        Marks the case as stored in store as described by its index record.
+        Until its files are written the text in memory is the only copy.
+        """
+        self.store = store
+        self.record = record
+        self.dirty = False
+        self.written = written
+
+    def read_input(self):
+        """The input, without keeping a stored one in memory."""
+        if self._test_string is None and self.store is not None:
+            return self.store.read(self.store.input_path(self.record['id']))
+        return self._test_string or ''
+
+    def get_input_file(self):
+        """The stored input file, if it can be a run's stdin as it is."""
+        if self.store is None or self.dirty or not self.written or not self.record['input_ends_with_newline']:
+            return None
+        return self.store.input_path(self.record['id'])
+
+    def input_size(self):
+        if self._test_string is None and self.store is not None:
+            return self.record['input_bytes']
+        return len(self._test_string or '')
+
+    def answer_sizes(self):
+        if self._correct_answers is None and self.store is not None:
+            return self.record['answer_bytes']
+        return [len(x) for x in self._correct_answers]
+
+    def input_digest(self):
+        """sha256 of the input, from the file's memoized digest when it is stored."""
+        if self.store is not None and not self.dirty and self.written:
+            return file_digest(self.store.input_path(self.record['id']))
+        return hashlib.sha256((self.test_string or '').encode('utf-8')).hexdigest()
+
+    def preview_text(self, block):
+        """
+        The 'input' or 'expected' text for the panel, a MappedText for big
+        stored files nothing has read yet.
+        """
+        stored = self.store is not None
+        if block == 'input':
+            if stored and self._test_string is None and self.record['input_bytes'] > self.preview_read_limit:
+                mapped = self.store.map_file(self.store.input_path(self.record['id']))
+                if mapped is not None:
+                    return mapped
+            return self.test_string or ''
+        if stored and self._correct_answers is None and self.record['answer_bytes'] \
+                and self.record['answer_bytes'][0] > self.preview_read_limit:
+            mapped = self.store.map_file(self.store.answer_path(self.record['id'], 0))
+            if mapped is not None:
+                return mapped
+        return next(iter(self.correct_answers), '')
+
+    def set_cur_runtime(self, runtime): self.runtime = runtime
+    def set_cur_rtcode(self, rtcode): self.rtcode = rtcode
+    def set_cur_usage(self, usage): self.usage = usage
+
+    def get_verdict(self, is_correct):
+        """Short verdict of the last run, as stored in the verdict cache."""
+        if self.rtcode is None: return None
+        if self.timed_out: return 'TLE'
+        if str(self.rtcode) in limit_verdicts: return str(self.rtcode)
+        if str(self.rtcode) != '0': return 'RE'
+        return {True: 'AC', False: 'WA'}.get(is_correct, 'OK')
+
+    def get_nice_runtime(self):
+        if isinstance(self.runtime, str): return self.runtime
+        return "{}ms".format(self.runtime)
+
+    def get_nice_usage(self):
+        if not self.usage: return ''
+        memory = self.usage['memory_kb']
+        if memory is None:
+            return "cpu {}ms".format(self.usage['cpu_ms'])
+        if memory >= 1024:
+            memory = "{:.1f}MB".format(memory / 1024)
+        else:
+            memory = "{}KB".format(memory)
+        return "cpu {}ms, {}".format(self.usage['cpu_ms'], memory)
+
+    def memorize(self):
+        return {'test': self.test_string, 'correct_answers': list(self.correct_answers)}
+
+class Tester(object):
+    """
+    Runs tests of one program, several at a time, and checks their output.
+    on_stop(id, rtcode, runtime, ...) is called through schedule, which
+    gets a callable to run: Sublime passes its async thread, the command
+    line runner calls it right away from the test's listener thread.
+    """
+
+    def __init__(self, process_manager, on_stop, sync_out=False, tests=[], schedule=None):
+        self.process_manager = process_manager
+        self.schedule = schedule or (lambda f: f())
+        self.sync_out = sync_out
+        self.tests = tests
+        self.on_stop = on_stop
+        self.prog_out = [''] * len(tests)
+        # OutputBuffer of every output that spilled to disk, None otherwise
+        self.prog_buffers = [None] * len(tests)
+        self.spill_verdicts = {}
+        # test id -> ProcessManager of the worker currently running it
+        self.running = {}
+        self.idle_workers = [process_manager]
+        self.lock = threading.Lock()
+        self.checker = get_checker(process_manager.file)
+
+    @property
+    def proc_run(self):
+        return bool(self.running)
+
+    def is_running(self, id):
+        return id in self.running
+
+    def __acquire_worker(self):
+        with self.lock:
+            if self.idle_workers:
+                return self.idle_workers.pop()
+        return self.process_manager.clone()
+
+    def __release_worker(self, worker):
+        with self.lock:
+            self.idle_workers.append(worker)
+
+    def __on_stop(self, id, worker, rtcode, runtime=-1, out=None, crash_line=None, timed_out=False, usage=None,
+                  mismatch=None):
+        with self.lock:
+            if self.running.get(id) is not worker: return
+            del self.running[id]
+
+        if out is not None and id < len(self.prog_out):
+            self.set_output(id, out)
+        self.on_stop(id, rtcode, runtime, crash_line=crash_line, timed_out=timed_out, usage=usage,
+                     mismatch=mismatch)
+
+    def get_matcher(self, id):
+        """Checker stream killing test id on its first wrong line, if early aborts are on."""
+        if not get_settings().get('early_wrong_answer_abort', False) or id >= len(self.tests):
+            return None
+        test = self.tests[id]
+        if not test.correct_answers:
+            return None
+        return self.checker.stream(test.correct_answers)
+
+    def __process_listener(self, id, proc):
+        out = OutputBuffer(get_settings().get('output_buffer_kb', 4096) * 1024)
+        timeout_duration = proc.get_time_limit(proc.limits)
+        output_limit = get_settings().get('output_limit_mb', 64) * 1024 * 1024
+        matcher = self.get_matcher(id)
+        aborted = []
+
+        def on_out(s):
+            out.write(s)
+            if matcher is not None and not aborted and not matcher.feed(s) and proc.process.returncode is None:
+                aborted.append(True)
+                proc.kill()
+
+        with measure(proc.timings, 'run', file=proc.file, test=id):
+            rtcode, runtime, timed_out = proc.wait_output(on_out if matcher else out.write, timeout_duration,
+                                                          output_limit=output_limit)
+        mismatch = None
+        if aborted:
+            # killed for a definitive Wrong Answer, the partial output proves it
+            rtcode, timed_out, mismatch = 0, False, matcher.describe()
+        elif proc.output_exceeded:
+            rtcode = 'OLE'
+        elif not timed_out:
+            rtcode = proc.get_limit_verdict(out.tail(4096)) or rtcode
+        usage = proc.get_usage()
+
+        self.__release_worker(proc)
+        self.schedule(lambda: self.__on_stop(
+            id, proc, rtcode, runtime, out=out, timed_out=timed_out, usage=usage, mismatch=mismatch))
+
+    def set_output(self, id, buffer):
+        if self.prog_buffers[id] is not None:
+            self.prog_buffers[id].close()
+        self.spill_verdicts.pop(id, None)
+        if buffer.spilled:
+            self.prog_out[id] = buffer.head().rstrip() + '\n... [{} characters in total, the rest is kept on disk]'.format(buffer.size)
+            self.prog_buffers[id] = buffer
+        else:
+            self.prog_out[id] = buffer.getvalue().rstrip()
+            self.prog_buffers[id] = None
+
+    def check(self, id):
+        """is_correct_answer() of the full output of test id, even when it spilled to disk."""
+        test = self.tests[id]
+        memo = test.check_memo
+        start = time.perf_counter()
+        verdict = self.__check(id)
+        timings = self.process_manager.timings
+        # memoized verdicts cost nothing worth counting, only new checks are timed
+        if timings is not None and test.check_memo is not memo:
+            timings.add('check', time.perf_counter() - start, file=self.process_manager.file, test=id)
+        return verdict
+
+    def __check(self, id):
+        test = self.tests[id]
+        buffer = self.prog_buffers[id] if id < len(self.prog_buffers) else None
+        if buffer is None:
+            return test.is_correct_answer(self.prog_out[id] if id < len(self.prog_out) else '', self.checker)
+
+        key = (buffer, frozenset(test.correct_answers), self.checker)
+        cached = self.spill_verdicts.get(id)
+        if cached is None or cached[0] != key:
+            cached = (key, test.is_correct_answer(buffer.getvalue().rstrip(), self.checker))
+            self.spill_verdicts[id] = cached
+        return cached[1]
+
+    def reset_outputs(self):
+        for buffer in self.prog_buffers:
+            if buffer is not None:
+                buffer.close()
+        self.prog_out = [''] * len(self.tests)
+        self.prog_buffers = [None] * len(self.tests)
+        self.spill_verdicts = {}
+
+    def add_test(self, test):
+        self.tests.append(test)
+        self.prog_out.append('')
+        self.prog_buffers.append(None)
+
+    def remove_test(self, id):
+        if self.prog_buffers[id] is not None:
+            self.prog_buffers[id].close()
+        del self.tests[id]
+        del self.prog_out[id]
+        del self.prog_buffers[id]
+        self.spill_verdicts = {}
+
+    def run_test(self, id, compile_first=True):
+        if compile_first:
+            cmp_data = self.process_manager.compile()
+            if cmp_data and cmp_data[0] != 0:
+                return
+
+        worker = self.__acquire_worker()
+        with self.lock:
+            self.running[id] = worker
+        self.prog_out[id] = ''
+        if self.prog_buffers[id] is not None:
+            self.prog_buffers[id].close()
+            self.prog_buffers[id] = None
+        
+        test = self.tests[id]
+        input_name, output_name = worker.get_io_files()
+        file_io = self.use_file_io(test)
+        if input_name or file_io:
+            # a stored input goes to the program straight from its file, or is copied
+            # into the scratch directory of a problem reading a named input file
+            stdin_file, input_text = test.get_input_file(), None
+            if stdin_file is None and input_name:
+                input_text = self.get_input(test)
+            elif stdin_file is None:
+                stdin_file = worker.spool_input(self.get_input(test))
+            # the stdout of a problem writing a named output file goes to its scratch directory
+            stdout_file = worker.spool_file('.out') if file_io and not output_name else None
+            worker.run(stdin_file=stdin_file, stdout_file=stdout_file, input_text=input_text)
+        else:
+            inp = self.get_input(test)
+            worker.run()
+            worker.write(inp)
+            # important: finish input so program knows no more data coming
+            worker.finish_input()
+
+        # every worker gets its own listener thread, the async thread is shared
+        listener = threading.Thread(target=self.__process_listener, args=(id, worker))
+        listener.daemon = True
+        listener.start()
+
+    @staticmethod
+    def get_input(test):
+        inp = test.read_input()
+        if not inp.endswith("\n"):
+            inp += "\n"
+        return inp
+
+    def use_file_io(self, test):
+        mode = get_settings().get('io_mode', 'auto')
+        if mode != 'auto':
+            return mode == 'file'
+        threshold = get_settings().get('file_io_threshold_kb', 1024) * 1024
+        expected = max(test.answer_sizes() or [0])
+        return test.input_size() + 1 >= threshold or expected >= threshold
+
+    def get_tests(self):
+        return self.tests
+        
+    def terminate(self, id=None):
+        with self.lock:
+            ids = list(self.running) if id is None else [id]
+            workers = [(i, self.running[i]) for i in ids if i in self.running]
+
+        for i, worker in workers:
+            worker.terminate()
+            self.__on_stop(i, worker, rtcode='ABORTED', runtime=-1)
@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+
+# phases in the order the summary lists them
+phases = ['compile', 'start', 'run', 'check', 'render', 'save']
+
+
+class Timings(object):
+    """
+    Time spent in each phase of testing over a session: how often it ran,
+    for how long in total and at most. With a trace file every measurement
+    is also appended to it as a JSON line.
+    """
+
+    def __init__(self, trace_file=None):
+        self.trace_file = trace_file
+        self.lock = threading.Lock()
+        self.phases = {}
+
+    def measure(self, phase, **info):
+        return Measurement(self, phase, info)
+
+    def add(self, phase, seconds, **info):
+        with self.lock:
+            count, total, longest = self.phases.get(phase, (0, 0.0, 0.0))
+            self.phases[phase] = (count + 1, total + seconds, max(longest, seconds))
+            if self.trace_file:
+                info.update(time=round(time.time(), 3), phase=phase, ms=round(seconds * 1000, 3))
+                try:
+                    with open(self.trace_file, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(info, sort_keys=True) + '\n')
+                except OSError:
+                    self.trace_file = None
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                phase: {'count': count, 'total_ms': round(total * 1000, 3), 'max_ms': round(longest * 1000, 3)}
+                for phase, (count, total, longest) in self.phases.items()
+            }
+
+    def summary(self):
+        """One line like `compile 812ms, start 2.1ms x30, ...`: total time, and how often if more than once."""
+        parts = []
+        with self.lock:
+            names = [x for x in phases if x in self.phases] + sorted(set(self.phases) - set(phases))
+            for phase in names:
+                count, total, longest = self.phases[phase]
+                part = '{} {}'.format(phase, nice_ms(total * 1000))
+                if count > 1:
+                    part += ' x{}'.format(count)
+                parts.append(part)
+        return ', '.join(parts)
+
+
+class Measurement(object):
+    def __init__(self, timings, phase, info):
+        self.timings = timings
+        self.phase = phase
+        self.info = info
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.add(self.phase, time.perf_counter() - self.start, **self.info)
+        return False
+
+
+def measure(timings, phase, **info):
+    """timings.measure(), timing nothing if timings is None."""
+    return Measurement(timings, phase, info)
+
+
+def timer(timings, phase, **info):
+    """A callback adding the seconds it gets to timings, for work done elsewhere; None if timings is None."""
+    if timings is None:
+        return None
+    return lambda seconds: timings.add(phase, seconds, **info)
+
+
+def nice_ms(ms):
+    if ms >= 1000:
+        return '{:.2f}s'.format(ms / 1000)
+    if ms >= 10:
+        return '{:.0f}ms'.format(ms)
+    return '{:.1f}ms'.format(ms)
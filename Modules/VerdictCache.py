@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from os import path
+
+from .WriteBehind import discard, flush, write_later
+
+# (path, size, mtime) -> sha256 of the file
+_file_digests = {}
+_file_digests_lock = threading.Lock()
+
+
+def file_digest(file):
+    """sha256 of a file's contents, memoized by its size and mtime."""
+    st = os.stat(file)
+    cache_key = (file, st.st_size, st.st_mtime_ns)
+    with _file_digests_lock:
+        if cache_key in _file_digests:
+            return _file_digests[cache_key]
+    h = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    with _file_digests_lock:
+        _file_digests[cache_key] = h.hexdigest()
+    return _file_digests[cache_key]
+
+
+class VerdictCache(object):
+    """
+    Results of earlier test runs, persisted next to the tests as
+    `<file>:results`. A result is keyed by a fingerprint of what ran (the
+    binary, or the source for interpreted languages), the input and the
+    limits it ran under, so it is only reused when running the test again
+    would execute exactly the same thing. Long outputs get a file of their
+    own in `<file>:results.d`, so the index stays small enough to rewrite
+    after every run.
+    """
+
+    version = 2
+    # outputs up to this many characters are kept in the index
+    inline_output_chars = 4096
+
+    def __init__(self, file, max_entries=2000, max_bytes=64 * 1024 * 1024):
+        self.file = file
+        self.output_dir = file + '.d'
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # loaded by the first get() or put(), which run off the UI thread
+        self.entries = None
+        # key -> output whose file is not written yet
+        self.unwritten = {}
+        self.dirty = False
+
+    def __load(self):
+        if self.entries is not None:
+            return
+        self.entries = {}
+        # a panel closed a moment ago may not have written it yet
+        flush(self.file)
+        try:
+            with open(self.file, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == self.version:
+                self.entries = data.get('entries', {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        try:
+            names = os.listdir(self.output_dir)
+        except OSError:
+            return
+        # left behind by a session that evicted them without saving the index
+        for name in set(names) - set(x.get('output_file') for x in self.entries.values()):
+            try:
+                os.remove(path.join(self.output_dir, name))
+            except OSError:
+                pass
+
+    @staticmethod
+    def make_key(fingerprint, input_digest, limits):
+        """input_digest: the sha256 hex digest of the test's input."""
+        h = hashlib.sha256()
+        h.update(fingerprint.encode('utf-8'))
+        h.update(b'\0')
+        h.update(bytes.fromhex(input_digest))
+        h.update(json.dumps(limits, sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            self.__load()
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            # the next put() saves it, a lookup alone never rewrites the index
+            entry['used'] = time.time()
+            entry = dict(entry)
+            output = self.unwritten.get(key)
+        if 'output_file' in entry and output is None:
+            try:
+                with open(path.join(self.output_dir, entry['output_file']), encoding='utf-8', newline='') as f:
+                    output = f.read()
+            except OSError:
+                return None
+        if output is not None:
+            entry['output'] = output
+        return entry
+
+    def put(self, key, result):
+        """result: 'output', 'rtcode', 'runtime', 'usage' and 'verdict' of a finished run."""
+        entry = dict(result)
+        output = entry['output']
+        entry['used'] = time.time()
+        entry['size'] = len(output)
+        with self.lock:
+            self.__load()
+            removed = []
+            if len(output) > self.inline_output_chars:
+                del entry['output']
+                entry['output_file'] = key
+                self.unwritten[key] = output
+            elif 'output_file' in self.entries.get(key, {}):
+                removed.append(key)
+            self.entries[key] = entry
+            removed += self.__evict()
+            for old in removed:
+                self.unwritten.pop(old, None)
+            self.dirty = True
+        # the writer thread takes self.lock once a file is written, so never under it
+        for old in removed:
+            self.__remove_output(old)
+        if 'output_file' in entry and key not in removed:
+            self.__write_output(key, output)
+
+    def __write_output(self, key, output):
+        def produce():
+            os.makedirs(self.output_dir, exist_ok=True)
+            return output
+
+        def written():
+            with self.lock:
+                if self.unwritten.get(key) is output:
+                    del self.unwritten[key]
+        write_later(path.join(self.output_dir, key), produce, written)
+
+    def __remove_output(self, key):
+        file = path.join(self.output_dir, key)
+        discard(file)
+        try:
+            os.remove(file)
+        except OSError:
+            pass
+
+    def __evict(self):
+        """
+        Drops the least recently used entries over max_entries or max_bytes
+        of output, returns the keys of those whose output has a file.
+        """
+        size = sum(x.get('size', 0) for x in self.entries.values())
+        removed = []
+        if len(self.entries) <= self.max_entries and size <= self.max_bytes:
+            return removed
+        for key in sorted(self.entries, key=lambda k: self.entries[k]['used']):
+            if len(self.entries) <= self.max_entries and size <= self.max_bytes:
+                break
+            entry = self.entries.pop(key)
+            size -= entry.get('size', 0)
+            if 'output_file' in entry:
+                removed.append(key)
+        return removed
+
+    def save(self, timed=None):
+        """Writes the index behind, see WriteBehind for timed."""
+        with self.lock:
+            if not self.dirty:
+                return
+            entries = dict((k, dict(v)) for k, v in self.entries.items())
+            self.dirty = False
+        write_later(self.file, lambda: json.dumps({'version': self.version, 'entries': entries}), timed=timed)
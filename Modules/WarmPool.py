@@ -0,0 +1,253 @@
+import array
+import json
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import threading
+from collections import namedtuple
+from os import path
+
+from .CompileCache import get_compiler_version
+
+zygote_script = path.join(path.dirname(path.abspath(__file__)), 'PythonZygote.py')
+
+# the part of wait4's rusage ProcessManager.get_usage() reads
+Rusage = namedtuple('Rusage', 'ru_utime ru_stime ru_maxrss')
+
+# interpreter argv -> running Zygote, ('exec',) -> the launcher
+_zygotes = {}
+_zygotes_lock = threading.Lock()
+
+# CDS archives a run is currently writing
+_dumping = set()
+_dumping_lock = threading.Lock()
+
+
+class WarmProcess(object):
+    """The part of subprocess.Popen ProcessManager uses, for a child forked by a zygote."""
+
+    def __init__(self, pid, stdin=None, stdout=None):
+        self.pid = pid
+        self.stdin = stdin
+        self.stdout = stdout
+        self.returncode = None
+        self.rusage = None
+        self.exited = threading.Event()
+
+    def set_exit(self, status, rusage):
+        self.rusage = rusage
+        if os.WIFSIGNALED(status):
+            self.returncode = -os.WTERMSIG(status)
+        else:
+            self.returncode = os.WEXITSTATUS(status)
+        self.exited.set()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        self.exited.wait(timeout)
+        return self.returncode
+
+    def kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+class Zygote(object):
+    """
+    A started PythonZygote.py for one interpreter, or with exec_only the
+    launcher execing argv. spawn() hands it the child's stdin and stdout
+    over a datagram socket and returns a WarmProcess, which a reader thread
+    completes once the zygote reports the child's exit status.
+    """
+
+    spawn_timeout = 5
+
+    def __init__(self, argv, exec_only=False):
+        self.argv = argv
+        self.sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            self.process = subprocess.Popen(
+                argv + [zygote_script, str(child_sock.fileno())] + (['exec'] if exec_only else []),
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                pass_fds=[child_sock.fileno()], start_new_session=True
+            )
+        finally:
+            child_sock.close()
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.replies = {}
+        self.waiting = {}
+        self.children = {}
+        self.exits = {}
+        t = threading.Thread(target=self.__reader)
+        t.daemon = True
+        t.start()
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def spawn(self, script, args, cwd, rlimits, stdin_fd, stdout_fd, argv=None):
+        """Forks a child running script, or execing argv, raises OSError if the zygote can't."""
+        event = threading.Event()
+        with self.lock:
+            self.next_id += 1
+            request_id = self.next_id
+            self.waiting[request_id] = event
+        request = {'id': request_id, 'script': script, 'args': args, 'cwd': cwd, 'rlimits': rlimits}
+        if argv is not None:
+            request['argv'] = argv
+        fds = array.array('i', [stdin_fd, stdout_fd])
+        try:
+            self.sock.sendmsg([json.dumps(request).encode('utf-8')],
+                              [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds.tobytes())])
+            if not event.wait(self.spawn_timeout):
+                raise OSError('warm interpreter did not answer')
+        finally:
+            with self.lock:
+                self.waiting.pop(request_id, None)
+                reply = self.replies.pop(request_id, {})
+        if 'pid' not in reply:
+            raise OSError(reply.get('error', 'warm interpreter failed to fork'))
+
+        proc = WarmProcess(reply['pid'])
+        with self.lock:
+            # a child dying right away can be reported before its pid reply is read
+            if proc.pid in self.exits:
+                proc.set_exit(*self.exits.pop(proc.pid))
+            else:
+                self.children[proc.pid] = proc
+        return proc
+
+    def close(self):
+        self.sock.close()
+        try:
+            self.process.kill()
+            self.process.wait()
+        except OSError:
+            pass
+
+    def __reader(self):
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                data = b''
+            if not data:
+                break
+            message = json.loads(data.decode('utf-8'))
+            with self.lock:
+                if 'id' in message:
+                    self.replies[message['id']] = message
+                    event = self.waiting.get(message['id'])
+                    if event is not None:
+                        event.set()
+                    continue
+                exit_info = (message['status'], Rusage(message['utime'], message['stime'], message['maxrss']))
+                proc = self.children.pop(message['pid'], None)
+                if proc is None:
+                    self.exits[message['pid']] = exit_info
+            if proc is not None:
+                proc.set_exit(*exit_info)
+
+        # the zygote is gone, nobody will report on the children it forked
+        with self.lock:
+            children, self.children = self.children, {}
+        for proc in children.values():
+            proc.set_exit(signal.SIGKILL, None)
+
+
+def get_zygote(argv):
+    """Returns the running zygote for an interpreter command, starting it on first use."""
+    key = tuple(argv)
+    with _zygotes_lock:
+        zygote = _zygotes.get(key)
+        if zygote is None or not zygote.alive():
+            zygote = _zygotes[key] = Zygote(list(argv))
+        return zygote
+
+
+def get_launcher():
+    """
+    The running launcher, started on first use, None where runs can't go
+    through one: off Linux, or without a python3 to run it.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    with _zygotes_lock:
+        launcher = _zygotes.get(('exec',))
+        if launcher is None or not launcher.alive():
+            python = shutil.which('python3')
+            if python is None:
+                return None
+            # -S: without site it is a few MB, which is where a child's peak RSS starts
+            launcher = _zygotes[('exec',)] = Zygote([python, '-S'], exec_only=True)
+        return launcher
+
+
+def close_all():
+    with _zygotes_lock:
+        zygotes = list(_zygotes.values())
+        _zygotes.clear()
+    for zygote in zygotes:
+        zygote.close()
+
+
+def split_python_argv(argv, source_file):
+    """
+    Splits a `python3 [flags] <source_file> [args]` run argv into
+    (interpreter argv, script args), None for anything else.
+    """
+    if source_file not in argv:
+        return None
+    i = argv.index(source_file)
+    if i == 0 or not re.match(r'(python|pypy)[0-9.]*$', path.basename(argv[0])):
+        return None
+    if any(not x.startswith('-') or x in ('-c', '-m') for x in argv[1:i]):
+        return None
+    return (argv[:i], argv[i + 1:])
+
+
+def java_major_version(cmd):
+    m = re.search(r'\b(?:openjdk|java) (\d+)', get_compiler_version(cmd))
+    return int(m.group(1)) if m else None
+
+
+def java_share_flags(cmd, archive, classes):
+    """
+    JVM flags running java on an AppCDS archive of the solution's classes,
+    dumping the archive first if it is missing or older than classes.
+    Empty for JVMs without dynamic archives (before 13) or while another
+    run is writing the archive.
+    """
+    try:
+        fresh = path.getmtime(archive) >= path.getmtime(classes)
+    except OSError:
+        fresh = False
+    if fresh:
+        return ['-XX:SharedArchiveFile=' + archive, '-Xshare:auto', '-Xlog:disable']
+
+    version = java_major_version(cmd)
+    if version is None or version < 13:
+        return []
+    with _dumping_lock:
+        if archive in _dumping:
+            return []
+        _dumping.add(archive)
+    try:
+        os.remove(archive)
+    except OSError:
+        pass
+    return ['-XX:ArchiveClassesAtExit=' + archive, '-Xlog:disable']
+
+
+def java_dump_done(archive):
+    with _dumping_lock:
+        _dumping.discard(archive)
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import threading
+import time
+
+# seconds a file waits for more changes before it is written, and at most
+debounce = 0.3
+max_delay = 2.0
+
+
+def atomic_write(file, text):
+    """Writes text to a temporary file next to file and renames it over file."""
+    tmp = '{}.{}.tmp'.format(file, os.getpid())
+    try:
+        with open(tmp, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, file)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class Writer(object):
+    """
+    Writes files behind their changes: write_later() only records the
+    newest content producer of a file, a thread calls it and writes the
+    result once the file saw no change for `debounce` seconds, or
+    `max_delay` after its first unsaved change. Writes of unchanged
+    content are skipped, files are replaced atomically.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        # file -> [produce, first change, last change, written, timed]
+        self.pending = {}
+        # file -> sha1 of what was last written
+        self.written = {}
+        # file -> lock held while it is being written
+        self.writing = {}
+        self.thread = None
+
+    def write_later(self, file, produce, written=None, timed=None):
+        """
+        produce() returns the file's text, it is called on the writer
+        thread, and so is written() once the file has that text, and then
+        timed() with the seconds producing and writing it took.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if file in self.pending:
+                self.pending[file][0] = produce
+                self.pending[file][2] = now
+                self.pending[file][3] = written
+                self.pending[file][4] = timed
+            else:
+                self.pending[file] = [produce, now, now, written, timed]
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.__run)
+                self.thread.daemon = True
+                self.thread.start()
+            self.changed.notify()
+
+    def flush(self, file=None):
+        """Writes file's pending change, or every pending change, right away."""
+        with self.lock:
+            files = list(self.pending) if file is None else [file]
+        for file in files:
+            self.__write(file)
+
+    def discard(self, file):
+        """Drops file's pending change, for when something else rewrites the file."""
+        with self.lock:
+            file_lock = self.writing.setdefault(file, threading.Lock())
+        with file_lock:
+            with self.lock:
+                self.pending.pop(file, None)
+                self.written.pop(file, None)
+
+    def __run(self):
+        while True:
+            with self.lock:
+                due, wait = [], None
+                now = time.monotonic()
+                for file, (produce, first, last, written, timed) in self.pending.items():
+                    at = min(last + debounce, first + max_delay)
+                    if at <= now:
+                        due.append(file)
+                    elif wait is None or at - now < wait:
+                        wait = at - now
+                if not due:
+                    self.changed.wait(wait)
+                    continue
+            for file in due:
+                self.__write(file)
+
+    def __write(self, file):
+        with self.lock:
+            file_lock = self.writing.setdefault(file, threading.Lock())
+        with file_lock:
+            with self.lock:
+                entry = self.pending.pop(file, None)
+            if entry is None:
+                return
+            try:
+                start = time.perf_counter()
+                text = entry[0]()
+                digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+                if self.written.get(file) != digest or not os.path.exists(file):
+                    atomic_write(file, text)
+                    with self.lock:
+                        self.written[file] = digest
+                if entry[3] is not None:
+                    entry[3]()
+                if entry[4] is not None:
+                    entry[4](time.perf_counter() - start)
+            except Exception as e:
+                print('FastOlympicCoding: cannot save {}: {}'.format(file, e))
+
+
+_writer = Writer()
+write_later = _writer.write_later
+flush = _writer.flush
+discard = _writer.discard
@@ -0,0 +1,22 @@
+"""
+Runs the saved tests of solutions without Sublime:
+
+    python3 -m Personalised_FOC solution.cpp [more files] [--settings FILE]
+
+from the Packages folder, or `python3 path/to/Personalised_FOC ...`.
+"""
+import importlib
+import sys
+from os import path
+
+if not __package__:
+    # started as a directory, make the relative imports work all the same
+    package_dir = path.dirname(path.abspath(__file__))
+    sys.path.insert(0, path.dirname(package_dir))
+    __package__ = path.basename(package_dir)
+    importlib.import_module(__package__)
+
+from .Modules.CommandLine import main
+
+if __name__ == '__main__':
+    sys.exit(main())
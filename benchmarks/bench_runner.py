@@ -0,0 +1,288 @@
+"""
+What the plugin itself costs per test, phase by phase.
+
+    python3 benchmarks/bench_runner.py [--quick] [--json FILE] [--compare FILE]
+
+Builds a `cat` solution in a temporary project and times the hot path
+with it: starting a test and waiting for it, pushing small and multi-MB
+input and output through pipes and spool files, checking answers, running
+suites of 10 to 1000 cases through Tester, rendering the cases panel with
+update_configs() and saving the cases with memorize_tests(). The solution
+does no work, so every number is overhead. Rendering runs against a
+minimal stand-in for Sublime's API, everything else is the code the
+plugin runs. Needs g++ and a POSIX system.
+
+--json saves the results, --compare prints them next to a saved run, so a
+change to the hot path can be checked for regressions.
+"""
+import argparse
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+from html import escape
+
+package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+package = os.path.basename(package_dir)
+
+CAT = r'''
+#include <cstdio>
+int main() {
+    static char buf[1 << 16];
+    size_t n;
+    while ((n = fread(buf, 1, sizeof buf, stdin)) > 0) fwrite(buf, 1, n, stdout);
+}
+'''
+
+
+def install_sublime_stand_in():
+    """Just enough of the sublime and sublime_plugin modules for test_manager to render."""
+    sublime = types.ModuleType('sublime')
+    sublime.LAYOUT_BLOCK = 1
+    sublime.html = types.SimpleNamespace(escape=escape)
+    sublime.Region = lambda a, b=None: (a, a if b is None else b)
+    sublime.Phantom = lambda region, content, layout, on_navigate=None: content
+    sublime.PhantomSet = type('PhantomSet', (object,), {
+        '__init__': lambda self, view, key='': None,
+        'update': lambda self, phantoms: None,
+    })
+    sublime.set_timeout = sublime.set_timeout_async = lambda f, delay=0: f()
+    sublime.status_message = lambda message: None
+    sublime.encode_value = lambda value, pretty=False: json.dumps(value, indent=4 if pretty else None)
+    sublime.decode_value = json.loads
+    sublime_plugin = types.ModuleType('sublime_plugin')
+    sublime_plugin.TextCommand = type('TextCommand', (object,), {})
+    sys.modules.setdefault('sublime', sublime)
+    sys.modules.setdefault('sublime_plugin', sublime_plugin)
+
+
+class View(object):
+    """The part of sublime.View update_configs() touches."""
+
+    class Settings(dict):
+        def set(self, key, value):
+            self[key] = value
+
+    def __init__(self):
+        self._settings = self.Settings()
+        self._size = 0
+
+    def settings(self):
+        return self._settings
+
+    def size(self):
+        return self._size
+
+    def run_command(self, name, args=None):
+        if name == 'append':
+            self._size += len(args['characters'])
+        elif args and args.get('action') == 'erase_all':
+            self._size = 0
+
+
+class Bench(object):
+    def __init__(self, root, quick):
+        self.root = root
+        self.quick = quick
+        self.results = []
+        settings = importlib.import_module(package + '.settings')
+        self.process_manager_module = importlib.import_module(package + '.Modules.ProcessManager')
+        self.tester_module = importlib.import_module(package + '.Modules.Tester')
+        self.checker_module = importlib.import_module(package + '.Modules.Checker')
+        self.command_line = importlib.import_module(package + '.Modules.CommandLine')
+        self.write_behind = importlib.import_module(package + '.Modules.WriteBehind')
+
+        self.command_line.load_settings([])
+        self.settings = settings.get_settings()
+        self.settings.update({
+            'run_settings': [{
+                'extensions': ['cpp'],
+                'compile_cmd': "g++ -O2 '{source_file}' -o '{file_name}'",
+                'run_cmd': "'./{file_name}' {args}",
+            }],
+            'early_wrong_answer_abort': False,
+            'stress_time_limit_seconds': 60,
+            'precompiled_headers': False,
+            'compile_cache': False,
+        })
+        settings.set_project_folder(root)
+        self.source = os.path.join(root, 'cat.cpp')
+        with open(self.source, 'w') as f:
+            f.write(CAT)
+        self.manager = self.new_manager()
+        rtcode, message = self.manager.compile()
+        if rtcode != 0:
+            sys.exit('compilation failed:\n' + message)
+
+    def new_manager(self):
+        return self.process_manager_module.ProcessManager(self.source, None,
+                                                          run_settings=self.settings['run_settings'])
+
+    def report(self, name, seconds, count=1, size=None):
+        """Records `count` operations of `size` bytes each taking `seconds` in total."""
+        per_op = seconds / count * 1000
+        line = '{:<48} {:10.3f} ms'.format(name, per_op)
+        result = {'name': name, 'ms': per_op}
+        if size:
+            result['mb_per_s'] = size * count / seconds / 1e6
+            line += ' {:10.1f} MB/s'.format(result['mb_per_s'])
+        elif count > 1:
+            result['per_s'] = count / seconds
+            line += ' {:10.0f} /s'.format(result['per_s'])
+        self.results.append(result)
+        print(line)
+        sys.stdout.flush()
+
+    def run_once(self, inp, file_io=False):
+        worker = self.manager
+        if file_io:
+            worker.run(stdin_file=worker.spool_input(inp), stdout_file=worker.spool_file('.out'))
+        else:
+            worker.run()
+            worker.write(inp)
+            worker.finish_input()
+        out = []
+        rtcode, runtime, timed_out = worker.wait_output(out.append, 60)
+        return ''.join(out)
+
+    def bench_spawn(self):
+        runs = 50 if self.quick else 300
+        self.run_once('1\n')
+        start = time.perf_counter()
+        for _ in range(runs):
+            self.run_once('1\n')
+        self.report('spawn + wait, 2 byte input', time.perf_counter() - start, runs)
+
+    def bench_io(self):
+        for mb in (1, 8):
+            inp = ('1234567 ' * 15 + '\n') * (mb * 1000 * 1000 // 121)
+            runs = 3 if self.quick else 10
+            for file_io in (False, True):
+                start = time.perf_counter()
+                for _ in range(runs):
+                    out = self.run_once(inp, file_io)
+                seconds = time.perf_counter() - start
+                assert len(out) == len(inp)
+                self.report('{} MB through {}'.format(mb, 'spool files' if file_io else 'pipes'),
+                            seconds, runs, len(inp))
+
+    def bench_check(self):
+        for mb in (0, 8):
+            if mb:
+                answer = ('1234567 ' * 15 + '\n') * (mb * 1000 * 1000 // 121)
+            else:
+                answer = '42\n'
+            output = answer.replace('\n', ' \n')
+            label = '{} MB'.format(mb) if mb else 'small'
+            runs = 3 if mb else 10000
+            for checker in (self.checker_module.ExactChecker(), self.checker_module.TokenChecker()):
+                start = time.perf_counter()
+                for i in range(runs):
+                    checker.prepared.clear()
+                    checker.check('', output, [answer])
+                self.report('check {} {}, answer prepared every time'.format(label, checker.name),
+                            time.perf_counter() - start, runs, len(output) if mb else None)
+                start = time.perf_counter()
+                for i in range(runs):
+                    checker.check('', output, [answer])
+                self.report('check {} {}, answer prepared once'.format(label, checker.name),
+                            time.perf_counter() - start, runs, len(output) if mb else None)
+
+    def make_tester(self, cases):
+        tests = [self.tester_module.Test({'test': '{}\n'.format(i), 'correct_answers': [str(i)]})
+                 for i in range(cases)]
+        return self.tester_module.Tester(self.manager, None, tests=tests)
+
+    def bench_suite(self, sizes):
+        for cases in sizes:
+            for workers in sorted({1, self.command_line.get_run_all_workers()}):
+                tester = self.make_tester(cases)
+                start = time.perf_counter()
+                self.command_line.run_tests(tester, workers)
+                seconds = time.perf_counter() - start
+                assert all(tester.check(i) for i in range(cases))
+                tester.reset_outputs()
+                self.report('suite of {} cases, {} worker{}'.format(cases, workers, 's' if workers > 1 else ''),
+                            seconds, cases)
+
+    def bench_render(self, sizes):
+        install_sublime_stand_in()
+        test_manager = importlib.import_module(package + '.test_manager')
+        for cases in sizes:
+            tester = self.make_tester(cases)
+            self.command_line.run_tests(tester, self.command_line.get_run_all_workers())
+            command = test_manager.TestManagerCommand(View())
+            command.tester = tester
+            command.dbg_file = self.source
+
+            start = time.perf_counter()
+            command.update_configs()
+            self.report('update_configs, {} cases, first render'.format(cases), time.perf_counter() - start)
+            runs = 20
+            start = time.perf_counter()
+            for _ in range(runs):
+                command.update_configs()
+            self.report('update_configs, {} cases, unchanged'.format(cases), time.perf_counter() - start, runs)
+            start = time.perf_counter()
+            for i in range(runs):
+                tester.tests[i % cases].fold = not tester.tests[i % cases].fold
+                command.update_configs()
+            self.report('update_configs, {} cases, one case folded'.format(cases),
+                        time.perf_counter() - start, runs)
+
+            # the files are written behind, flushing counts that write to the save it belongs to
+            start = time.perf_counter()
+            for _ in range(runs):
+                command.memorize_tests()
+                self.write_behind.flush()
+            self.report('memorize_tests, {} cases'.format(cases), time.perf_counter() - start, runs)
+            tester.reset_outputs()
+
+
+def compare(results, file):
+    with open(file, encoding='utf-8') as f:
+        before = {x['name']: x['ms'] for x in json.load(f)}
+    print('\n{:<48} {:>10} {:>10} {:>8}'.format('', 'before', 'now', 'change'))
+    for result in results:
+        if result['name'] in before:
+            old = before[result['name']]
+            print('{:<48} {:10.3f} {:10.3f} {:+7.0f}%'.format(
+                result['name'], old, result['ms'], (result['ms'] - old) / old * 100 if old else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the per-test overhead of the plugin.')
+    parser.add_argument('--quick', action='store_true', help='fewer runs and smaller suites')
+    parser.add_argument('--json', metavar='FILE', help='save the results')
+    parser.add_argument('--compare', metavar='FILE', help='compare with results saved by --json')
+    args = parser.parse_args()
+    if not shutil.which('g++'):
+        sys.exit('g++ not found')
+    sys.path.insert(0, os.path.dirname(package_dir))
+
+    root = tempfile.mkdtemp(prefix='foc-bench-')
+    try:
+        bench = Bench(root, args.quick)
+        sizes = (10, 100) if args.quick else (10, 100, 1000)
+        bench.bench_spawn()
+        bench.bench_io()
+        bench.bench_check()
+        bench.bench_suite(sizes)
+        bench.bench_render(sizes)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        importlib.import_module(package + '.Modules.WarmPool').close_all()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(bench.results, f, indent=1)
+    if args.compare:
+        compare(bench.results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
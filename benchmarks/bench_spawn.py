@@ -0,0 +1,85 @@
+"""
+Per-spawn overhead of the ways ProcessManager can start a test.
+
+    python3 benchmarks/bench_spawn.py [runs]
+
+Compiles a C++ program that exits right away into a temporary directory
+and starts it `runs` times with each strategy. Needs g++ and a POSIX
+system, standalone so it runs outside Sublime Text.
+"""
+import os
+import resource
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+STACK = 256 * 1024 * 1024
+
+
+def preexec():
+    os.setsid()
+    resource.setrlimit(resource.RLIMIT_STACK, (STACK, resource.getrlimit(resource.RLIMIT_STACK)[1]))
+
+
+def run_shell(cwd, binary):
+    # before: the formatted template through /bin/sh, limits in preexec_fn
+    p = subprocess.Popen("./'{}' ".format(os.path.basename(binary)), shell=True, cwd=cwd,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                         preexec_fn=preexec)
+    p.communicate(b'')
+
+
+def run_argv_limits(cwd, binary):
+    # after, with rlimits configured: direct exec, limits in preexec_fn
+    p = subprocess.Popen(['./' + os.path.basename(binary)], cwd=cwd,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                         preexec_fn=preexec)
+    p.communicate(b'')
+
+
+def run_argv(cwd, binary):
+    # after, without rlimits: direct exec, subprocess is free to use vfork
+    p = subprocess.Popen(['./' + os.path.basename(binary)], cwd=cwd,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                         start_new_session=True)
+    p.communicate(b'')
+
+
+def run_posix_spawn(cwd, binary):
+    # lower bound: posix_spawn can't set the working directory ProcessManager needs
+    pid = os.posix_spawn(binary, [binary], os.environ, setsid=True)
+    os.waitpid(pid, 0)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    if not shutil.which('g++'):
+        sys.exit('g++ not found')
+    cwd = tempfile.mkdtemp(prefix='foc-bench-')
+    try:
+        source = os.path.join(cwd, 'noop.cpp')
+        binary = os.path.join(cwd, 'noop')
+        with open(source, 'w') as f:
+            f.write('int main() { return 0; }\n')
+        subprocess.check_call('g++ -O2 {} -o {}'.format(shlex.quote(source), shlex.quote(binary)), shell=True)
+
+        strategies = [('shell=True + preexec_fn', run_shell), ('argv + preexec_fn', run_argv_limits),
+                      ('argv + start_new_session', run_argv)]
+        if hasattr(os, 'posix_spawn'):
+            strategies.append(('os.posix_spawn', run_posix_spawn))
+        for name, run in strategies:
+            run(cwd, binary)
+            start = time.perf_counter()
+            for _ in range(runs):
+                run(cwd, binary)
+            elapsed = time.perf_counter() - start
+            print('{:<28} {:8.3f} ms/spawn'.format(name, elapsed / runs * 1000))
+    finally:
+        shutil.rmtree(cwd, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
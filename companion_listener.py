@@ -12,7 +12,8 @@ from os import path
 import sublime
 import sublime_plugin
 
-from .settings import get_settings, get_meta_file_path, get_tests_file_path
+from .Modules.TestStore import get_store
+from .settings import get_settings, get_meta_file_path
 
 # --- Global variables to manage the server thread ---
 SERVER_THREAD = None
@@ -176,9 +177,7 @@ class FocParseProblemCommand(sublime_plugin.WindowCommand):
                     }
                 )
 
-            tests_file = get_tests_file_path(file_path)
-            with open(tests_file, "w", encoding="utf-8") as f:
-                f.write(sublime.encode_value(tests_to_write, True))
+            get_store(file_path).replace(tests_to_write)
 
             # Save problem metadata (URL, name, group) for the submitter
             meta_to_write = {
@@ -186,6 +185,22 @@ class FocParseProblemCommand(sublime_plugin.WindowCommand):
                 "name": data.get("name", ""),
                 "group": data.get("group", ""),
             }
+            # the judge's limits, timeLimit in ms and memoryLimit in MB
+            limits = {}
+            if data.get("timeLimit"):
+                limits["time_limit_seconds"] = data["timeLimit"] / 1000
+            if data.get("memoryLimit"):
+                limits["memory_limit_mb"] = data["memoryLimit"]
+            if limits:
+                meta_to_write["limits"] = limits
+            # files the solution reads and writes instead of stdin and stdout
+            io_files = {}
+            for key in ("input", "output"):
+                declared = data.get(key) or {}
+                if declared.get("type") == "file" and declared.get("fileName"):
+                    io_files[key] = declared["fileName"]
+            if io_files:
+                meta_to_write["io"] = io_files
             meta_file = get_meta_file_path(file_path)
             with open(meta_file, "w", encoding="utf-8") as f:
                 f.write(json.dumps(meta_to_write, indent=2))
@@ -1,5 +1,12 @@
-import sublime
+import json
+import multiprocessing
 import os
+import re
+try:
+    import sublime
+except ImportError:
+    # running outside Sublime, see __main__.py
+    sublime = None
 
 # --- Your existing code (restored) ---
 root_dir = os.path.split(__file__)[0]
@@ -8,6 +15,12 @@ settings_file = 'FastOlympicCoding.sublime-settings'
 default_settings_file = settings_file
 tests_file_suffix = ':tests'
 settings = {}
+# folder .TestCases and .Compiled go in when there is no Sublime window to ask
+project_folder = None
+
+# a string, or a comment to drop from a .sublime-settings file, then a trailing comma
+_settings_comment_re = re.compile(r'("(?:\\.|[^"\\])*")|//[^\n]*|/\*.*?\*/', re.S)
+_settings_comma_re = re.compile(r'("(?:\\.|[^"\\])*")|,(?=\s*[}\]])')
 
 def get_settings():
     return settings
@@ -16,6 +29,22 @@ def init_settings(_settings):
     global settings
     settings = _settings
 
+def set_project_folder(folder):
+    global project_folder
+    project_folder = folder
+
+def read_settings_file(file):
+    """Loads a .sublime-settings file, which is JSON with comments and trailing commas."""
+    with open(file, encoding='utf-8') as f:
+        text = f.read()
+    for junk_re in (_settings_comment_re, _settings_comma_re):
+        text = junk_re.sub(lambda m: m.group(1) or '', text)
+    return json.loads(text)
+
+def status_message(msg):
+    if sublime is not None:
+        sublime.status_message(msg)
+
 def is_run_supported_ext(ext):
     _run_settings = get_settings().get('run_settings', None)
     if _run_settings is not None:
@@ -26,6 +55,17 @@ def is_run_supported_ext(ext):
 
 
 
+def get_run_all_workers():
+    """Number of tests run in parallel, run_all_workers or one per CPU core."""
+    workers = get_settings().get('run_all_workers', 0)
+    if not workers or workers < 1:
+        try:
+            workers = multiprocessing.cpu_count()
+        except NotImplementedError:
+            workers = 1
+    return max(1, int(workers))
+
+
 def try_load_settings():
     _settings = sublime.load_settings(settings_file)
     if _settings is None:
@@ -45,6 +85,8 @@ def get_tests_file_suffix():
 
 def get_project_folder():
     """Finds the first open folder in the window, which is the project root."""
+    if project_folder is not None or sublime is None:
+        return project_folder
     window = sublime.active_window()
     if window and window.folders():
         return window.folders()[0]
@@ -100,4 +142,24 @@ def get_meta_file_path(source_file):
     base = os.path.basename(source_file)
     return os.path.join(test_cases_dir, base + ':meta')
 
-# --- NEW MERGED FUNCTIONS END ---
\ No newline at end of file
+# --- NEW MERGED FUNCTIONS END ---
+def get_results_file_path(source_file):
+    """
+    Returns the path for the cached test results inside the .TestCases directory.
+    """
+    test_cases_dir = get_hidden_folder_path('.TestCases')
+    if not test_cases_dir:
+        return source_file + ':results'
+
+    base = os.path.basename(source_file)
+    return os.path.join(test_cases_dir, base + ':results')
+
+def get_timings_trace_file(source_file):
+    """
+    The timings_trace_file setting as a path, relative ones next to the
+    source file. None when tracing is off.
+    """
+    trace_file = get_settings().get('timings_trace_file')
+    if not trace_file:
+        return None
+    return os.path.join(os.path.dirname(source_file), os.path.expanduser(trace_file))
@@ -0,0 +1,190 @@
+import json
+import threading
+from os import path
+
+import sublime
+import sublime_plugin
+
+from .Modules.Checker import get_checker
+from .Modules.ProcessManager import ProcessManager
+from .Modules.StressTester import StressTester
+from .Modules.TestStore import get_store
+from .settings import get_meta_file_path, get_run_all_workers, get_settings
+from .test_manager import TestManagerCommand
+
+# The stress test currently running, at most one at a time
+STRESS_TESTER = None
+
+
+class CompilingStressTest(object):
+    """Holds the STRESS_TESTER slot while the programs compile, remembers a stop."""
+
+    def __init__(self):
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+def find_companion_source(source_file, patterns):
+    """Finds e.g. `<name>_gen.cpp` or `gen.py` next to source_file."""
+    source_dir = path.dirname(source_file)
+    file_name = path.splitext(path.basename(source_file))[0]
+    exts = []
+    for option in get_settings().get('run_settings', []):
+        exts.extend(option['extensions'])
+    for pattern in patterns:
+        base = pattern.format(file_name=file_name)
+        for ext in exts:
+            candidate = path.join(source_dir, '{}.{}'.format(base, ext))
+            if path.exists(candidate) and candidate != source_file:
+                return candidate
+    return None
+
+
+def read_meta(source_file):
+    try:
+        with open(get_meta_file_path(source_file), 'r', encoding='utf-8') as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def write_meta(source_file, meta):
+    with open(get_meta_file_path(source_file), 'w', encoding='utf-8') as f:
+        f.write(json.dumps(meta, indent=2))
+
+
+def same_answer(inp, expected, out, checker=None):
+    test = TestManagerCommand.Test({'test': inp, 'correct_answers': [expected]})
+    return test.is_correct_answer(out, checker)
+
+
+class FocStressTestCommand(sublime_plugin.WindowCommand):
+    """
+    Compares the solution with a brute force on generated tests. The
+    generator gets the seed as its only argument, the first failing
+    input is appended to the problem's test cases.
+    """
+
+    def run(self, resume=False, seed=None, iterations=None):
+        global STRESS_TESTER
+        if STRESS_TESTER is not None:
+            sublime.status_message('FastOlympicCoding: a stress test is already running')
+            return
+
+        view = self.window.active_view()
+        source_file = view.file_name() if view else None
+        if not source_file:
+            sublime.error_message("FOC Stress: No file is open.")
+            return
+        if view.is_dirty():
+            view.run_command('save')
+
+        settings = get_settings()
+        generator = find_companion_source(source_file, settings.get('stress_generator', ['{file_name}_gen', 'gen']))
+        brute = find_companion_source(source_file, settings.get('stress_brute', ['{file_name}_brute', 'brute']))
+        if not generator or not brute:
+            sublime.error_message(
+                "FOC Stress: Put a generator ({}_gen or gen) and a brute force ({}_brute or brute) "
+                "next to the solution.".format(*[path.splitext(path.basename(source_file))[0]] * 2)
+            )
+            return
+
+        if seed is None:
+            seed = read_meta(source_file).get('stress', {}).get('next_seed', 1) if resume else 1
+        if iterations is None:
+            iterations = settings.get('stress_iterations', 10000)
+
+        # claimed before compiling, so a second start is refused and Stop works from now on
+        STRESS_TESTER = CompilingStressTest()
+
+        panel = self.window.create_output_panel('foc_stress')
+        panel.settings().set('word_wrap', True)
+        panel.settings().set('gutter', False)
+        panel.settings().set('line_numbers', False)
+        self.window.run_command('show_panel', {'panel': 'output.foc_stress'})
+        self._append(panel, 'FOC Stress: {} vs {} (generator {}), seeds {}..{}\n'.format(
+            path.basename(source_file), path.basename(brute), path.basename(generator),
+            seed, seed + iterations - 1))
+
+        threading.Thread(target=self._run, args=(panel, source_file, generator, brute, seed, iterations)).start()
+
+    def _run(self, panel, source_file, generator, brute, seed, iterations):
+        global STRESS_TESTER
+        try:
+            self._stress(panel, source_file, generator, brute, seed, iterations)
+        finally:
+            STRESS_TESTER = None
+
+    def _stress(self, panel, source_file, generator, brute, seed, iterations):
+        global STRESS_TESTER
+        run_settings = get_settings().get('run_settings')
+        managers = []
+        for file in (generator, brute, source_file):
+            manager = ProcessManager(file, None, run_settings=run_settings)
+            cmp_data = manager.compile()
+            if cmp_data and cmp_data[0] != 0:
+                self._append(panel, 'Compilation of {} failed:\n{}\n'.format(path.basename(file), cmp_data[1]))
+                return
+            managers.append(manager)
+
+        workers = get_run_all_workers()
+        checker = get_checker(source_file)
+        compiling = STRESS_TESTER
+        STRESS_TESTER = StressTester(
+            managers[0], managers[1], managers[2],
+            lambda inp, expected, out: same_answer(inp, expected, out, checker),
+            timeout=get_settings().get('stress_time_limit_seconds', 2),
+            workers=workers,
+            output_limit=get_settings().get('output_limit_mb', 64) * 1024 * 1024,
+            on_progress=lambda done, next_seed, rate: sublime.status_message(
+                'FOC Stress: {} iterations, seed {}, {:.1f} it/s'.format(done, next_seed, rate))
+        )
+        # a stop while compiling, checked after the swap so none can get lost
+        if compiling.stopped:
+            STRESS_TESTER.stop()
+        result = STRESS_TESTER.run(start_seed=seed, iterations=iterations)
+        STRESS_TESTER = None
+
+        rate = result['iterations'] / result['elapsed'] if result['elapsed'] else 0
+        self._append(panel, '{} iterations in {:.1f}s ({:.1f} it/s) on {} workers\n'.format(
+            result['iterations'], result['elapsed'], rate, workers))
+
+        meta = read_meta(source_file)
+        meta['stress'] = {'next_seed': result['next_seed']}
+        write_meta(source_file, meta)
+
+        if result['status'] == 'ok':
+            self._append(panel, 'No difference found.\n')
+        elif result['status'] == 'stopped':
+            self._append(panel, 'Stopped, resume from seed {}.\n'.format(result['next_seed']))
+        else:
+            self._append(panel, '{}\n\nInput:\n{}\nExpected:\n{}\nGot:\n{}\n'.format(
+                result['message'], result['input'], result['expected'], result['output']))
+            if result['status'] == 'mismatch':
+                case = self._add_test(source_file, result['input'], result['expected'])
+                self._append(panel, 'Added as Case {}.\n'.format(case))
+
+    def _add_test(self, source_file, inp, expected):
+        case = get_store(source_file).append({'test': inp, 'correct_answers': [expected]})
+
+        def reload_panel():
+            source_view = self.window.find_open_file(source_file)
+            if source_view:
+                self.window.focus_view(source_view)
+                source_view.run_command('view_tester', {'action': 'make_opd'})
+        sublime.set_timeout(reload_panel, 10)
+        return case
+
+    def _append(self, panel, text):
+        sublime.set_timeout(lambda: panel.run_command('append', {'characters': text, 'scroll_to_end': True}), 0)
+
+
+class FocStopStressTestCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        if STRESS_TESTER is not None:
+            STRESS_TESTER.stop()
+
+    def is_enabled(self):
+        return STRESS_TESTER is not None
@@ -0,0 +1,64 @@
+import os
+import threading
+import zipfile
+from os import path
+
+import sublime
+import sublime_plugin
+
+from .Modules.TestImport import import_tests
+from .Modules.TestStore import get_store
+
+
+class FocImportTestsCommand(sublime_plugin.WindowCommand):
+    """
+    Adds the tests of a zip or a folder to the active file's problem:
+    `name.in` with `name.out`, `name.ans` or `name.a`, and Polygon's `name`
+    with `name.a`. Cases already stored are skipped, then the test panel
+    opens and runs them all.
+    """
+
+    def run(self, source=None, replace=False):
+        view = self.window.active_view()
+        source_file = view.file_name() if view else None
+        if not source_file:
+            sublime.error_message("FOC Import: No file is open.")
+            return
+        if view.is_dirty():
+            view.run_command('save')
+
+        if source is None:
+            self.window.show_input_panel(
+                'Import tests from (zip or folder):', path.dirname(source_file) + os.sep,
+                lambda source: self.run(source=source, replace=replace), None, None)
+            return
+
+        source = path.abspath(path.expanduser(source.strip()))
+        if not path.exists(source):
+            sublime.error_message("FOC Import: {} does not exist.".format(source))
+            return
+        threading.Thread(target=self._import, args=(source_file, source, replace)).start()
+
+    def _import(self, source_file, source, replace):
+        name = path.basename(source)
+        try:
+            result = import_tests(
+                get_store(source_file), source, replace=replace,
+                on_progress=lambda done, total: sublime.status_message(
+                    'FOC Import: {} of {} files read from {}'.format(done, total, name)))
+        except (OSError, ValueError, zipfile.BadZipFile) as e:
+            sublime.error_message("FOC Import: Cannot import {}:\n{}".format(name, e))
+            return
+
+        message = 'FOC Import: {} cases imported from {}'.format(result['imported'], name)
+        if result['duplicates']:
+            message += ', {} duplicates skipped'.format(result['duplicates'])
+        sublime.status_message(message)
+        print(message)
+
+        def run_all():
+            source_view = self.window.find_open_file(source_file)
+            if source_view:
+                self.window.focus_view(source_view)
+                source_view.run_command('view_tester', {'action': 'make_opd', 'run_all': True})
+        sublime.set_timeout(run_all, 10)